@@ -1,16 +1,55 @@
 from typing import List, Dict
 from enum import Enum
 
-import logging, math, random, sys
+import cProfile, json, logging, math, multiprocessing, os, random, sys, threading, time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 from board import MAX_NUM_PIECES, MIN_NUM_PIECES, Board, Player, Phase
+from table_file import mix
+
+try:
+    import numpy as np
+except ImportError:  # only needed for BatchEvaluator
+    np = None
 
 log = logging.getLogger(__name__)
+# One JSON record per get_best_move, see SearchStats
+stats_log = logging.getLogger(__name__ + '.stats')
 
 MAXINT = sys.maxsize
 MININT = -sys.maxsize -1
 
+# The search packs a move into an int: dest in bits 0-4, src in bits 5-9
+# and the removed node in bits 10-14, with NO_NODE for no src or removal.
+# PLACING_FLAG is set for placements and P2_FLAG when the SimulateGame p2
+# player moves, so SimulateGame.do and undo need nothing else.
+NO_NODE = 31
+SRC_SHIFT = 5
+REMOVE_SHIFT = 10
+NODE_MASK = 31
+NO_SRC = NO_NODE << SRC_SHIFT
+NO_REMOVE = NO_NODE << REMOVE_SHIFT
+PLACING_FLAG = 1 << 15
+P2_FLAG = 1 << 16
+HISTORY_MASK = (1 << REMOVE_SHIFT) - 1
+
+def move_src(move):
+    src = (move >> SRC_SHIFT) & NODE_MASK
+    return None if src == NO_NODE else src
+
+def move_dest(move):
+    return move & NODE_MASK
+
+def move_remove(move):
+    remove = (move >> REMOVE_SHIFT) & NODE_MASK
+    return None if remove == NO_NODE else remove
+
 class Move:
+    """A move handed out by the search. src, dest and remove are SimulateGame
+    node indices. Inside the search moves are packed ints, see pack and unpack.
+    """
+    __slots__ = ('player_id', 'phase', 'src', 'dest', 'remove', 'score')
+
     def __init__(self, player_id, phase, src = None, dest = None, remove = None):
         self.player_id = player_id
         self.phase = phase
@@ -29,322 +68,1191 @@ class Move:
     def set_score(self, score):
         self.score = score
 
+    def pack(self, sim_board):
+        """The move as a packed int for sim_board."""
+        return ((PLACING_FLAG if self.phase == Phase.PLACING else 0) |
+                (P2_FLAG if self.player_id == sim_board.p2_id else 0) |
+                (NO_NODE if self.src is None else self.src) << SRC_SHIFT | self.dest |
+                (NO_NODE if self.remove is None else self.remove) << REMOVE_SHIFT)
+
+    @classmethod
+    def unpack(cls, move, sim_board):
+        """Move for a packed int move on sim_board."""
+        return cls(sim_board.p2_id if move & P2_FLAG else sim_board.p1_id,
+                   Phase.PLACING if move & PLACING_FLAG else Phase.MOVING,
+                   src = move_src(move), dest = move_dest(move), remove = move_remove(move))
+
+    @property
+    def src_name(self):
+        return SimulateGame.nodes[self.src] if self.src is not None else None
+
+    @property
+    def dest_name(self):
+        return SimulateGame.nodes[self.dest] if self.dest is not None else None
+
+    @property
+    def remove_name(self):
+        return SimulateGame.nodes[self.remove] if self.remove is not None else None
+
+def iter_bits(mask):
+    """Yield the node index of every set bit in a bitboard, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
 class SimulateGame:
+    """Lightweight copy of the game state used by the search.
+
+    The position is kept as one 24 bit integer (bitboard) per player. Bit i is
+    set when the player has a piece on node i, where node indices follow the
+    order of Board.node_map. do and undo also keep the Zobrist hash and the
+    evaluation (line_codes and score) up to date.
+    """
+
     @classmethod
     def init_cls(cls):
+        """Build the class tables (nodes, mills, symmetries, Zobrist keys
+        and so on) the first time it is called, later calls do nothing.
+        """
+        if cls.nodes:
+            return
         _fake_board = Board()
-        for node in _fake_board.get_nodes():
-            cls._init_board[node.name] = 0
-            cls.neighbors[node.name] = {x[0]: getattr(getattr(node, x), 'name', None) for x in ['north', 'east', 'south', 'west']}
+        cls.nodes = list(Board.node_map)
+        cls.node_index = {name: i for i, name in enumerate(cls.nodes)}
+        for name in cls.nodes:
+            node = _fake_board.board[name]
+            cls.neighbors.append([cls.node_index[x.name] for x in node.neighbors()])
+            cls.neighbor_masks.append(sum(1 << i for i in cls.neighbors[-1]))
+
+        for check, (x, y) in [(cls.ns_check, ('north', 'south')), (cls.ew_check, ('east', 'west'))]:
+            for name in check:
+                node = _fake_board.board[name]
+                line = [name, getattr(node, x).name, getattr(node, y).name]
+                cls.mills.append(sum(1 << cls.node_index[n] for n in line))
+
+        # The two mill lines running through every node
+        cls.node_mills = [tuple(line for line in cls.mills if (line >> i) & 1) for i in range(len(cls.nodes))]
+
+        # Zobrist keys. The generator is seeded so keys, and therefore
+        # transposition table contents, are the same in every process.
+        rng = random.Random(0x4E4D4D)
+        cls.zobrist_pieces = [[rng.getrandbits(64) for _ in cls.nodes] for _ in range(2)]
+        cls.zobrist_placed = [[rng.getrandbits(64) for _ in range(MAX_NUM_PIECES + 1)] for _ in range(2)]
+        cls.zobrist_turn = rng.getrandbits(64)
+
+        cls.init_symmetries()
+
+        cls.line_score = [[cls.score_line(p, o) for o in range(4)] for p in range(4)]
+        cls.center_mask = sum(1 << cls.node_index[n] for n in ['d2', 'd6', 'b4', 'f4'])
+        cls.side_mask = sum(1 << cls.node_index[n] for n in ['a4', 'c4', 'd1', 'd3', 'd5', 'd7', 'e4', 'g4'])
 
-    _init_board, neighbors = {}, {}
+        # Incremental evaluation. A line's code is 4 * (p1 pieces on it) +
+        # (p2 pieces on it) and line_values[code] is its score for p1.
+        cls.line_values = [cls.line_score[code >> 2][code & 3] if (code >> 2) + (code & 3) <= 3 else 0 for code in range(16)]
+        cls.node_lines = [tuple(cls.mills.index(line) for line in lines) for lines in cls.node_mills]
+        cls.node_weights = [2 * ((cls.center_mask >> i) & 1) + ((cls.side_mask >> i) & 1) for i in range(len(cls.nodes))]
+
+    @classmethod
+    def init_symmetries(cls):
+        """Build the 16 symmetries of the board as node permutations.
+
+        With node names read as coordinates around d4 the symmetries are the
+        4 rotations and 4 reflections of the square, each with or without
+        swapping the outer and inner rings. symmetries[0] is the identity.
+        Bitboards are mapped a byte at a time with symmetry_bytes, which
+        holds for every symmetry six 256 entry tables covering the 48 bit
+        board of SimulateGame.encode.
+        """
+        def coords(name):
+            return ord(name[0]) - ord('d'), int(name[1]) - 4
+
+        def swap_rings(x, y):
+            ring = max(abs(x), abs(y))
+            return x * (4 - ring) // ring, y * (4 - ring) // ring
+
+        squares = [lambda x, y: (x, y), lambda x, y: (-y, x), lambda x, y: (-x, -y), lambda x, y: (y, -x),
+                   lambda x, y: (-x, y), lambda x, y: (y, x), lambda x, y: (x, -y), lambda x, y: (-y, -x)]
+        index = {coords(name): i for i, name in enumerate(cls.nodes)}
+        for rings in [False, True]:
+            for square in squares:
+                perm = []
+                for name in cls.nodes:
+                    x, y = square(*coords(name))
+                    perm.append(index[swap_rings(x, y) if rings else (x, y)])
+                cls.symmetries.append(perm)
+
+        # Node maps for packed moves, NO_NODE stays NO_NODE
+        cls.symmetry_nodes = [perm + [NO_NODE] * (NO_NODE + 1 - len(perm)) for perm in cls.symmetries]
+        identity = list(range(len(cls.nodes)))
+        cls.symmetry_inverse = [next(t for t, other in enumerate(cls.symmetries)
+                                     if [other[n] for n in perm] == identity) for perm in cls.symmetries]
+        for perm in cls.symmetries:
+            tables = []
+            for offset in range(0, 48, 8):
+                table = []
+                for byte in range(256):
+                    mask = 0
+                    for bit in iter_bits(byte):
+                        node = offset + bit
+                        mask |= 1 << (perm[node % 24] + node // 24 * 24)
+                    table.append(mask)
+                tables.append(table)
+            cls.symmetry_bytes.append(tables)
+
+    @staticmethod
+    def transform(pieces, symmetry):
+        """Bitboard pieces mapped by SimulateGame.symmetries[symmetry]."""
+        t = SimulateGame.symmetry_bytes[symmetry]
+        return t[0][pieces & 255] | t[1][(pieces >> 8) & 255] | t[2][pieces >> 16]
+
+    @staticmethod
+    def transform_move(move, symmetry):
+        """Packed move with every node mapped by SimulateGame.symmetries[symmetry]."""
+        t = SimulateGame.symmetry_nodes[symmetry]
+        return (move & ~0x7FFF | t[move & NODE_MASK] | t[(move >> SRC_SHIFT) & NODE_MASK] << SRC_SHIFT |
+                t[(move >> REMOVE_SHIFT) & NODE_MASK] << REMOVE_SHIFT)
+
+    @staticmethod
+    def score_line(player_pieces, opponent_pieces):
+        empty = 3 - player_pieces - opponent_pieces
+        if player_pieces == 3:
+            return 100
+        elif player_pieces == 2 and empty == 1:
+            return 10
+        elif player_pieces == 1 and empty == 2:
+            return 1
+        elif opponent_pieces == 3:
+            return -100
+        elif opponent_pieces == 2 and empty == 1:
+            return -10
+        elif opponent_pieces == 1 and empty == 2:
+            return -1
+        return 0
+
+    nodes, node_index, neighbors, neighbor_masks, mills, node_mills, line_score = [], {}, [], [], [], [], []
+    line_values, node_lines, node_weights = [], [], []
+    zobrist_pieces, zobrist_placed, zobrist_turn = [], [], 0
+    symmetries, symmetry_inverse, symmetry_bytes, symmetry_nodes = [], [], [], []
     ns_check = ['a4', 'b4', 'c4', 'e4', 'f4', 'g4', 'd2', 'd6']
     ew_check = ['d1', 'd2', 'd3', 'd5', 'd6', 'd7', 'b4', 'f4']
-    
+    full_mask = (1 << len(Board.node_map)) - 1
+    center_mask = 0
+    side_mask = 0
 
     def __init__(self, p1_id=None, p2_id=None):
-        if not SimulateGame._init_board:
-            SimulateGame.init_cls()
-        self.board = dict(SimulateGame._init_board)
+        SimulateGame.init_cls()
         self.p1_id = p1_id
         self.p2_id = p2_id
-        self.player_data = {
-            self.p1_id: {'num_placed': 0,
-                         'num_on_board': 0
-            },
-            self.p2_id: {'num_placed': 0,
-                         'num_on_board': 0
-            },
-        }
+        self.bitboards = {self.p1_id: 0, self.p2_id: 0}
+        self.num_placed = {self.p1_id: 0, self.p2_id: 0}
+        self.z_pieces = {self.p1_id: SimulateGame.zobrist_pieces[0], self.p2_id: SimulateGame.zobrist_pieces[1]}
+        self.z_placed = {self.p1_id: SimulateGame.zobrist_placed[0], self.p2_id: SimulateGame.zobrist_placed[1]}
+        self.hash = self.compute_hash()
+        self.compute_score()
+
+    def num_on_board(self, p_id):
+        return self.bitboards[p_id].bit_count()
 
     def get_phase(self, p_id):
-        if self.player_data[p_id]['num_placed'] < MAX_NUM_PIECES:
+        if self.num_placed[p_id] < MAX_NUM_PIECES:
             return Phase.PLACING
-        elif self.player_data[p_id]['num_on_board'] > MIN_NUM_PIECES:
+        elif self.bitboards[p_id].bit_count() > MIN_NUM_PIECES:
             return Phase.MOVING
         else:
             return Phase.FLYING
 
     def set_state(self, board, player1=None, player2=None):
         for player in [player1, player2]:
-            self.player_data[player.id]['num_placed'] = MAX_NUM_PIECES - len(player.pieces)
-        
+            self.num_placed[player.id] = MAX_NUM_PIECES - len(player.pieces)
+            self.bitboards[player.id] = 0
+
         for node in board.get_nodes():
             if node.is_occupied():
                 p_id = node.piece.player.id
-                self.board[node.name] = p_id
-                self.player_data[p_id]['num_on_board'] += 1
-            else:
-                self.board[node.name] = 0
+                self.bitboards[p_id] |= 1 << SimulateGame.node_index[node.name]
+
+        self.hash = self.compute_hash()
+        self.compute_score()
+
+    def snapshot(self):
+        """Compact, picklable copy of the position:
+        (p1_id, p2_id, p1 bitboard, p2 bitboard, p1 placed, p2 placed)
+        """
+        return (self.p1_id, self.p2_id,
+                self.bitboards[self.p1_id], self.bitboards[self.p2_id],
+                self.num_placed[self.p1_id], self.num_placed[self.p2_id])
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        p1_id, p2_id, p1_bits, p2_bits, p1_placed, p2_placed = snapshot
+        sim_board = cls(p1_id=p1_id, p2_id=p2_id)
+        sim_board.bitboards[p1_id], sim_board.bitboards[p2_id] = p1_bits, p2_bits
+        sim_board.num_placed[p1_id], sim_board.num_placed[p2_id] = p1_placed, p2_placed
+        sim_board.hash = sim_board.compute_hash()
+        sim_board.compute_score()
+        return sim_board
+
+    def compute_hash(self):
+        """Zobrist hash of the position from scratch. do/undo keep self.hash
+        up to date incrementally.
+        """
+        result = 0
+        for p_id, pieces in self.bitboards.items():
+            for node in iter_bits(pieces):
+                result ^= self.z_pieces[p_id][node]
+            result ^= self.z_placed[p_id][self.num_placed[p_id]]
+        return result
+
+    def compute_score(self):
+        """Set line_codes and score from scratch. score is the evaluation
+        for p1, do/undo keep both up to date incrementally.
+        """
+        p1_bits, p2_bits = self.bitboards[self.p1_id], self.bitboards[self.p2_id]
+        self.line_codes = [4 * (p1_bits & line).bit_count() + (p2_bits & line).bit_count() for line in SimulateGame.mills]
+        weights = SimulateGame.node_weights
+        self.score = (sum(SimulateGame.line_values[code] for code in self.line_codes) +
+                      sum(weights[node] for node in iter_bits(p1_bits)) - sum(weights[node] for node in iter_bits(p2_bits)))
+
+    def adjust(self, node, step, value):
+        # step is added to the codes of the lines through node, value to the score
+        codes = self.line_codes
+        line_values = SimulateGame.line_values
+        score = self.score + value
+        for line in SimulateGame.node_lines[node]:
+            code = codes[line]
+            score += line_values[code + step] - line_values[code]
+            codes[line] = code + step
+        self.score = score
+
+    def encode(self, curr_player):
+        """Exact 57 bit encoding of the position with curr_player to move:
+        both bitboards, both placed counts and the side to move. Unlike the
+        Zobrist hash it can't collide, which makes it the key for tables
+        stored on disk.
+        """
+        return (self.bitboards[self.p1_id] | self.bitboards[self.p2_id] << 24 |
+                self.num_placed[self.p1_id] << 48 | self.num_placed[self.p2_id] << 52 |
+                (curr_player == self.p2_id) << 56)
+
+    def canonical_key(self, curr_player):
+        """Smallest encode() over all 16 symmetries of the position.
+
+        Returns (key, symmetry). Symmetric positions get the same key, which
+        makes it the key to use for tables of positions. A move stored
+        with the key is turned into one for this position with
+        transform_move(move, SimulateGame.symmetry_inverse[symmetry]).
+        """
+        code = self.encode(curr_player)
+        best, best_symmetry = code & 0xFFFFFFFFFFFF, 0
+        for symmetry, t in enumerate(SimulateGame.symmetry_bytes):
+            board = (t[0][code & 255] | t[1][(code >> 8) & 255] | t[2][(code >> 16) & 255] |
+                     t[3][(code >> 24) & 255] | t[4][(code >> 32) & 255] | t[5][(code >> 40) & 255])
+            if board < best:
+                best, best_symmetry = board, symmetry
+        return best | code >> 48 << 48, best_symmetry
+
+    def key(self, curr_player):
+        """Hash of the position with curr_player to move."""
+        return self.hash ^ SimulateGame.zobrist_turn if curr_player == self.p2_id else self.hash
 
     def get_opponent(self, p_id):
         return self.p2_id if p_id == self.p1_id else self.p1_id
 
-    def do(self, move):
-        if move.phase == Phase.PLACING:
-            self.player_data[move.player_id]['num_placed'] += 1
-            self.player_data[move.player_id]['num_on_board'] += 1
+    def pack_move(self, p_id, phase, src=None, dest=None, remove=None):
+        """Packed int move for this board, see Move.pack."""
+        return Move(p_id, phase, src=src, dest=dest, remove=remove).pack(self)
 
-        if move.phase == Phase.MOVING or move.phase == Phase.FLYING: #move
-            self.board[move.src] = 0
+    def do(self, move):
+        """Play a packed move."""
+        bitboards = self.bitboards
+        weights = SimulateGame.node_weights
+        if move & P2_FLAG:
+            p_id, opp, step, sign = self.p2_id, self.p1_id, 1, -1
+        else:
+            p_id, opp, step, sign = self.p1_id, self.p2_id, 4, 1
+        dest = move & NODE_MASK
+        z_pieces = self.z_pieces[p_id]
+        h = self.hash ^ z_pieces[dest]
+        if move & PLACING_FLAG:
+            placed = self.num_placed[p_id]
+            h ^= self.z_placed[p_id][placed] ^ self.z_placed[p_id][placed + 1]
+            self.num_placed[p_id] = placed + 1
+        else: #move
+            src = (move >> SRC_SHIFT) & NODE_MASK
+            bitboards[p_id] ^= 1 << src
+            h ^= z_pieces[src]
+            self.adjust(src, -step, -sign * weights[src])
 
-        self.board[move.dest] = move.player_id
+        bitboards[p_id] |= 1 << dest
+        self.adjust(dest, step, sign * weights[dest])
 
-        if move.remove:
-            opp = self.get_opponent(move.player_id)
-            self.player_data[opp]['num_on_board'] += -1
-            self.board[move.remove] = 0
+        remove = (move >> REMOVE_SHIFT) & NODE_MASK
+        if remove != NO_NODE:
+            bitboards[opp] ^= 1 << remove
+            h ^= self.z_pieces[opp][remove]
+            self.adjust(remove, step - 5, sign * weights[remove])
+        self.hash = h
 
     def undo(self, move):
-        if move.phase == Phase.PLACING:
-            self.player_data[move.player_id]['num_placed'] += -1
-            self.player_data[move.player_id]['num_on_board'] += -1
+        """Take back a packed move played with do."""
+        bitboards = self.bitboards
+        weights = SimulateGame.node_weights
+        if move & P2_FLAG:
+            p_id, opp, step, sign = self.p2_id, self.p1_id, 1, -1
+        else:
+            p_id, opp, step, sign = self.p1_id, self.p2_id, 4, 1
+        dest = move & NODE_MASK
+        z_pieces = self.z_pieces[p_id]
+        h = self.hash ^ z_pieces[dest]
+        if move & PLACING_FLAG:
+            placed = self.num_placed[p_id]
+            h ^= self.z_placed[p_id][placed] ^ self.z_placed[p_id][placed - 1]
+            self.num_placed[p_id] = placed - 1
+        else: #move
+            src = (move >> SRC_SHIFT) & NODE_MASK
+            bitboards[p_id] |= 1 << src
+            h ^= z_pieces[src]
+            self.adjust(src, step, sign * weights[src])
+
+        bitboards[p_id] ^= 1 << dest
+        self.adjust(dest, -step, -sign * weights[dest])
 
-        if move.phase == Phase.MOVING or move.phase == Phase.FLYING: #move
-            self.board[move.src] = move.player_id
-        
-        self.board[move.dest] = 0
+        remove = (move >> REMOVE_SHIFT) & NODE_MASK
+        if remove != NO_NODE:
+            bitboards[opp] |= 1 << remove
+            h ^= self.z_pieces[opp][remove]
+            self.adjust(remove, 5 - step, -sign * weights[remove])
+        self.hash = h
 
-        if move.remove:
-            opp = self.get_opponent(move.player_id)
-            self.player_data[opp]['num_on_board'] += 1
-            self.board[move.remove] = self.get_opponent(move.player_id)
+    def occupied(self):
+        return self.bitboards[self.p1_id] | self.bitboards[self.p2_id]
 
     def is_empty(self, node):
-        return self.board[node] == 0
+        return not (self.occupied() >> node) & 1
 
     def is_occupied(self, node):
         return not self.is_empty(node)
 
+    def get_mill_mask(self, p_id):
+        """Bitboard of the nodes that are part of one of the players mills."""
+        pieces = self.bitboards[p_id]
+        mask = 0
+        for line in SimulateGame.mills:
+            if pieces & line == line:
+                mask |= line
+        return mask
+
     def get_mills(self):
-        mills = {
-            self.p1_id: [],
-            self.p2_id: []
-        }
-
-        for i in [SimulateGame.ns_check, SimulateGame.ew_check]:
-            if i == SimulateGame.ns_check:
-                x, y = 'n', 's'
-            else:
-                x, y = 'e', 'w'
+        """Bitboard of the nodes that are part of a mill, per player."""
+        return {p_id: self.get_mill_mask(p_id) for p_id in self.bitboards}
 
-            for j in i:
-                a = j
-                b = SimulateGame.neighbors[j][x]
-                c = SimulateGame.neighbors[j][y]
-                a_player, b_player, c_player = self.board[a], self.board[b], self.board[c]
-                if a_player != 0 and a_player == b_player == c_player:
-                    mills[a_player].extend([a,b,c])
+    def mill_threats(self, p_id):
+        """Bitboard of the empty nodes that would complete one of the
+        players mills if the player had a piece there.
+        """
+        pieces = self.bitboards[p_id]
+        empty = ~self.occupied()
+        threats = 0
+        for line in SimulateGame.mills:
+            rest = line & ~pieces
+            if rest & empty and not rest & (rest - 1):
+                threats |= rest
+        return threats
 
-        return mills
+    def closes_mill(self, p_id, dest, src=None):
+        """True if moving the players piece from src (None when placing) to
+        dest would complete a mill through dest. The position is not changed.
+        """
+        pieces = self.bitboards[p_id] | (1 << dest)
+        if src is not None:
+            pieces ^= 1 << src
+        for line in SimulateGame.node_mills[dest]:
+            if pieces & line == line:
+                return True
+        return False
 
     def get_pieces(self):
-        pieces = {
-            self.p1_id: [],
-            self.p2_id: []
-        }
-
-        for node, player in self.board.items():
-            if player != 0:
-                pieces[player].append(node)
-        
-        return pieces
+        return {p_id: list(iter_bits(pieces)) for p_id, pieces in self.bitboards.items()}
 
     def evaluate(self, curr_player):
-        opp_player = self.get_opponent(curr_player)
-        score = 0
-
-        for check in [SimulateGame.ns_check, SimulateGame.ew_check]:
-            if check == SimulateGame.ns_check:
-                dir1, dir2 = 'n', 's'
-            else:
-                dir1, dir2 = 'e', 'w'
-
-            for node in check:
-                player_pieces, opponent_pieces, empty = 0, 0, 0
-                node1 = node
-                node2 = SimulateGame.neighbors[node][dir1]
-                node3 = SimulateGame.neighbors[node][dir2]
-                player1, player2, player3 = self.board[node1], self.board[node2], self.board[node3]
-                for k in [player1, player2, player3]:
-                    if k == curr_player:
-                        player_pieces += 1
-                    elif k == opp_player:
-                        opponent_pieces += 1
-                    else:
-                        empty += 1
-            
-
-                if player_pieces == 3:
-                    score += 100
-                elif player_pieces == 2 and empty == 1:
-                    score += 10
-                elif player_pieces == 1 and empty == 2:
-                    score += 1
-                elif opponent_pieces == 3:
-                    score += -100
-                elif opponent_pieces == 2 and empty == 1:
-                    score += -10
-                elif opponent_pieces == 1 and empty == 2:
-                    score += -1
-            
-        for node, player in self.board.items():
-            sub_score = 0
-            if node in ['d2', 'd6', 'b4', 'f4']:
-                sub_score = 2
-            elif node in ['a4', 'c4', 'd1', 'd3', 'd5', 'd7', 'e4', 'g4']:
-                sub_score = 1
-            
-            if player == curr_player:
-                score += sub_score
-            elif player == opp_player:
-                score += -sub_score
-
-        return score + random.randint(-2,2)
+        """Score of the position for curr_player: the lines scored by
+        score_line plus 2 for every center and 1 for every side point, minus
+        the same for the opponent. Kept up to date by do and undo.
+        """
+        return self.score if curr_player == self.p1_id else -self.score
 
     def game_over(self, p_id):
-        if self.get_phase(p_id) != Phase.PLACING:
-            return self.player_data[p_id]['num_on_board'] < MIN_NUM_PIECES
+        if self.num_placed[p_id] >= MAX_NUM_PIECES:
+            return self.bitboards[p_id].bit_count() < MIN_NUM_PIECES
         else:
             return False
 
+class BatchEvaluator:
+    """SimulateGame.evaluate for many positions at once with NumPy.
+
+    A position is a 2x24 occupancy array (p1 row, p2 row). Line counts come
+    from multiplying by the 16x24 line incidence matrix and are scored with
+    SimulateGame.line_score, positional points from the node weights. All
+    scores are for p1, like SimulateGame.score.
+    """
+
+    def __init__(self):
+        if np is None:
+            raise ImportError("BatchEvaluator needs numpy")
+        SimulateGame.init_cls()
+        num_nodes = len(SimulateGame.nodes)
+        self.node_bits = np.left_shift(np.int64(1), np.arange(num_nodes, dtype=np.int64))
+        self.lines = np.array([[(line >> i) & 1 for i in range(num_nodes)] for line in SimulateGame.mills], dtype=np.int64)
+        self.line_score = np.array(SimulateGame.line_score, dtype=np.int64)
+        self.weights = np.array(SimulateGame.node_weights, dtype=np.int64)
+
+    def occupancy(self, p1_bits, p2_bits):
+        """(N, 2, 24) occupancy array for N pairs of bitboards."""
+        bits = np.stack([np.asarray(p1_bits, dtype=np.int64), np.asarray(p2_bits, dtype=np.int64)], axis=-1)
+        return (bits[..., None] & self.node_bits != 0).astype(np.int64)
+
+    def evaluate(self, occupancy):
+        """p1 scores of an (N, 2, 24) occupancy array."""
+        counts = occupancy @ self.lines.T
+        scores = self.line_score[counts[:, 0], counts[:, 1]].sum(axis=1)
+        return scores + occupancy[:, 0] @ self.weights - occupancy[:, 1] @ self.weights
+
+    def evaluate_bitboards(self, p1_bits, p2_bits):
+        return self.evaluate(self.occupancy(p1_bits, p2_bits))
+
+    def evaluate_moves(self, sim_board, curr_player, moves):
+        """p1 scores of the positions after each of curr_player's packed moves."""
+        moves = np.asarray(moves, dtype=np.int64)
+        dest = moves & NODE_MASK
+        src = (moves >> SRC_SHIFT) & NODE_MASK
+        remove = (moves >> REMOVE_SHIFT) & NODE_MASK
+        # NO_NODE shifts a bit past the board, which is masked off
+        full = SimulateGame.full_mask
+        mover = (sim_board.bitboards[curr_player] ^ (np.left_shift(1, src) & full)) | np.left_shift(1, dest)
+        other = sim_board.bitboards[sim_board.get_opponent(curr_player)] ^ (np.left_shift(1, remove) & full)
+        if curr_player == sim_board.p1_id:
+            return self.evaluate_bitboards(mover, other)
+        return self.evaluate_bitboards(other, mover)
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the time budget has run out or the
+    search was stopped."""
+
+class TranspositionTable:
+    """Fixed size table of searched positions keyed by SimulateGame.key, or
+    by the mixed canonical_key with AI_Player.CANONICAL_TT.
+
+    Every bucket has two slots. The first keeps the deepest search of the
+    current generation and the second is overwritten by everything else, so
+    shallow recent results still get stored without pushing out expensive
+    deep ones. Entries are (key, depth, flag, score, best_move, generation).
+    """
+    EXACT, LOWER, UPPER = 0, 1, 2
+
+    def __init__(self, size=1 << 16):
+        self.size = 1 << (size - 1).bit_length()
+        self.mask = self.size - 1
+        self.depth_slots = [None] * self.size
+        self.recent_slots = [None] * self.size
+        self.generation = 0
+
+    def new_search(self):
+        # Entries from older searches stay usable but may be replaced
+        self.generation += 1
+
+    def clear(self):
+        self.depth_slots = [None] * self.size
+        self.recent_slots = [None] * self.size
+
+    def probe(self, key):
+        i = key & self.mask
+        entry = self.depth_slots[i]
+        if entry is not None and entry[0] == key:
+            return entry
+        entry = self.recent_slots[i]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, depth, flag, score, best_move):
+        i = key & self.mask
+        entry = (key, depth, flag, score, best_move, self.generation)
+        old = self.depth_slots[i]
+        if old is None or old[0] == key or depth >= old[1] or old[5] != self.generation:
+            self.depth_slots[i] = entry
+        else:
+            self.recent_slots[i] = entry
+
+class SearchStats:
+    """What one search did.
+
+    Counters: nodes (alpha_beta calls), evaluations (leaves scored),
+    generate_moves, pruned (beta cutoffs), cutoff_first (cutoffs by the
+    first move tried), tt_probes, tt_hits, tt_cutoffs, endgame_hits,
+    book_hits and ponder_hits. cutoffs counts the cutoffs per
+    AI_Player.ORDER_KINDS kind and cutoffs_by_ply per ply. expanded and
+    moves count the positions moves were generated for and the moves
+    generated, per phase, for the branching factor. source says where the
+    move came from: search, book, ponder or forced (the only move).
+    """
+    COUNTERS = ('nodes', 'evaluations', 'generate_moves', 'pruned', 'cutoff_first', 'tt_probes', 'tt_hits',
+                'tt_cutoffs', 'endgame_hits', 'book_hits', 'ponder_hits')
+
+    def __init__(self):
+        for counter in SearchStats.COUNTERS:
+            setattr(self, counter, 0)
+        self.cutoffs = {}
+        self.cutoffs_by_ply = {}
+        self.expanded = {}
+        self.moves = {}
+        self.source = 'search'
+        self.depth = 0
+        self.elapsed = 0.0
+
+    @property
+    def nodes_per_sec(self):
+        return self.nodes / self.elapsed if self.elapsed else 0.0
+
+    def branching(self):
+        """Average number of moves per expanded position, per phase."""
+        return {phase: self.moves[phase] / expanded for phase, expanded in self.expanded.items() if expanded}
+
+    def merge(self, other):
+        """Add the counters of another search, like a worker's."""
+        for counter in SearchStats.COUNTERS:
+            setattr(self, counter, getattr(self, counter) + getattr(other, counter))
+        for name in ('cutoffs', 'cutoffs_by_ply', 'expanded', 'moves'):
+            mine = getattr(self, name)
+            for key, value in getattr(other, name).items():
+                mine[key] = mine.get(key, 0) + value
+
+    def as_dict(self):
+        record = {'source': self.source, 'depth': self.depth, 'elapsed_ms': round(self.elapsed * 1000, 3),
+                  'nodes_per_sec': round(self.nodes_per_sec)}
+        record.update((counter, getattr(self, counter)) for counter in SearchStats.COUNTERS)
+        record['cutoffs'] = dict(self.cutoffs)
+        record['cutoffs_by_ply'] = {str(ply): count for ply, count in sorted(self.cutoffs_by_ply.items())}
+        record['branching'] = {phase: round(value, 2) for phase, value in self.branching().items()}
+        return record
+
+
 class AI_Player(Player):
     MAX_SCORE = 999999
     DEPTH = 3
+    MAX_DEPTH = 32
     PRUNING = True
+    TRANSPOSITION = True
+    TT_SIZE = 1 << 17
+    # Share entries between symmetric positions. Costs a canonical_key per
+    # node, which mostly pays off in the placing phase.
+    CANONICAL_TT = False
+    ORDERING = True
+    KILLERS = True
+    HISTORY = True
+    ORDER_SHIFT = 24
+    ORDER_KINDS = ('history', 'killer', 'block', 'mill', 'tt')
+    WORKERS = 1
+    ENDGAME_DB = None
+    OPENING_BOOK = None
+    # Score the leaves below a depth 1 node with one BatchEvaluator call.
+    # Incremental evaluation makes single leaves cheap, so this mostly pays
+    # off with wide nodes, like flying.
+    BATCH_EVAL = False
+    # Directory to write a cProfile dump of every get_best_move to
+    PROFILE = None
 
-    def __init__(self, name, id, board: "Board", opponent: "Player"):
+    def __init__(self, name, id, board: "Board", opponent: "Player", workers=None, seed=None):
         super().__init__(name, id, board)
         self.opponent = opponent
-        self.calls = {
-            'alpha_beta': 0,
-            'evaluate': 0,
-            'generate_moves': 0,
-            'pruned': 0
-        }
+        self.workers = workers or AI_Player.WORKERS
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.searches = 0
+        self.executor = None
+        self.search_thread = None
+        self.stop_event = threading.Event()
+        # stop_event for the processes of self.executor
+        self.cancel = None
+        self.ponder_future = None
+        # Results of ponder by SimulateGame.encode of the position
+        self.pondered = {}
+        # Of the last search, get_best_move and search start new ones
+        self.stats = SearchStats()
+        self.profile = AI_Player.PROFILE
+        # Kept across turns; get_best_move only ages the entries
+        self.tt = TranspositionTable(AI_Player.TT_SIZE)
+        self.depth = AI_Player.DEPTH
+        self.deadline = None
+        self.endgame_db = AI_Player.ENDGAME_DB
+        self.opening_book = AI_Player.OPENING_BOOK
+        self.batch_eval = BatchEvaluator() if AI_Player.BATCH_EVAL and np is not None else None
+        self.killers = [[None, None] for _ in range(AI_Player.MAX_DEPTH + 2)]
+        self.history = {}
     
-    def get_best_move(self):
-        
-        phase = self.get_phase()
+    def get_best_move(self, time_budget_ms=None):
+        """Search the current position and return the best Move.
+
+        The search deepens one ply at a time, starting each iteration with
+        the root moves ordered by the previous iteration's scores. Without a
+        time budget it stops after self.depth plies. With one it keeps
+        deepening (up to MAX_DEPTH) until the budget runs out and returns
+        the result of the deepest iteration that finished. The first
+        iteration always runs to completion so there is always a move.
+        After that stop_search also ends the search early, the same way.
+        Positions in self.opening_book are answered from the book instead,
+        and positions searched by ponder straight from its results.
 
+        Afterwards self.stats has the statistics of the search, which are
+        also logged to the ai_player.stats logger as JSON.
+        """
+        self.clear_stop()
+        return self.find_best_move(time_budget_ms)
+
+    def find_best_move(self, time_budget_ms=None):
+        """get_best_move without clearing an earlier stop_search, for
+        search_async, which clears it before the search can start.
+        """
         sim_board = SimulateGame(p1_id = self.opponent.id, p2_id = self.id)
         sim_board.set_state(self.board, player1 = self.opponent, player2 = self)
-        opp = sim_board.get_opponent(self.id)
+
+        pondered = self.pondered.get(sim_board.encode(self.id))
+        self.pondered = {}
+        if pondered is not None:
+            self.searches += 1
+            self.stats = SearchStats()
+            self.stats.source = 'ponder'
+            self.stats.ponder_hits = 1
+            found = pondered
+        elif self.profile:
+            found = self.profiled_search(sim_board, time_budget_ms)
+        else:
+            found = self.search(sim_board, time_budget_ms)
+        self.log_stats()
+        if found is None:
+            return None
+        move, score = found
+
+        best = Move.unpack(move, sim_board)
+        best.score = score
+        return best
+
+    def search(self, sim_board, time_budget_ms=None):
+        """The search behind get_best_move, for this player to move on
+        sim_board. Returns (packed move, score) or None without a move.
+        """
+        start = time.monotonic()
+        self.searches += 1
+        self.stats = stats = SearchStats()
+        self.new_search()
+        try:
+            return self.iterative_deepening(sim_board, time_budget_ms, start)
+        finally:
+            stats.elapsed = time.monotonic() - start
+
+    def iterative_deepening(self, sim_board, time_budget_ms, start):
+        stats = self.stats
+        self.deadline = None
 
         moves = self.generate_moves(self.id, sim_board)
-        
-        max_score = -AI_Player.MAX_SCORE
-        scored_moves = {}
-        scored_moves[max_score] = []
+        if not moves:
+            return None
+        if len(moves) == 1:
+            stats.source = 'forced'
+            return moves[0], 0
+        if self.opening_book:
+            book_move = self.opening_book.choose(sim_board, self.id, self.rng)
+            if book_move in moves:
+                stats.book_hits += 1
+                stats.source = 'book'
+                return book_move, 0
+        moves = [move for _, move in self.order_moves(moves, self.id, sim_board, 0)]
+
+        max_depth = AI_Player.MAX_DEPTH if time_budget_ms is not None else self.depth
+        scores = None
+        for depth in range(1, max_depth + 1):
+            try:
+                if self.workers > 1:
+                    iteration_scores = self.search_root_parallel(sim_board, moves, depth)
+                else:
+                    iteration_scores = self.search_root(sim_board, moves, depth)
+            except SearchTimeout:
+                break
+            scores, stats.depth = iteration_scores, depth
+            moves = sorted(moves, key=lambda move: scores[move], reverse=True)
+
+            if max(scores.values()) >= AI_Player.MAX_SCORE or self.stop_event.is_set():
+                break
+            if time_budget_ms is not None:
+                elapsed_ms = (time.monotonic() - start) * 1000
+                # The next iteration takes longer than all previous ones
+                # together, so don't start one that can't finish in time
+                if elapsed_ms * 2 > time_budget_ms:
+                    break
+                self.deadline = start + time_budget_ms / 1000
+            else:
+                # No time limit, but alpha_beta still watches for stop_search
+                self.deadline = math.inf
+        self.deadline = None
+
+        max_score = scores[moves[0]]
+
+        log.debug("Searched to depth %d in %.0f ms", stats.depth, (time.monotonic() - start) * 1000)
+        if stats.tt_probes:
+            log.debug("Transposition table hit rate: %.1f%%", 100 * stats.tt_hits / stats.tt_probes)
+
+        return self.rng.choice([move for move in moves if scores[move] == max_score]), max_score
+
+    def profiled_search(self, sim_board, time_budget_ms=None):
+        """search under cProfile. The profile is written to the self.profile
+        directory, to be read with pstats or snakeviz.
+        """
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(self.search, sim_board, time_budget_ms)
+        finally:
+            os.makedirs(self.profile, exist_ok=True)
+            path = os.path.join(self.profile, 'search-%s-%d.prof' % (self.name, self.searches))
+            profiler.dump_stats(path)
+            log.info("Wrote search profile to %s", path)
+
+    def log_stats(self):
+        if stats_log.isEnabledFor(logging.INFO):
+            record = {'player': self.name, 'search': self.searches}
+            record.update(self.stats.as_dict())
+            stats_log.info(json.dumps(record), extra={'search_stats': record})
+
+    def ponder(self, snapshot, time_budget_ms=None):
+        """Search on the opponent's time.
+
+        snapshot is the position with the opponent to move, set up the way
+        get_best_move sets up its board. Each likely reply is played and
+        the position after it searched like get_best_move would, most
+        likely reply first, until stop_search. Finished searches go into
+        self.pondered, so get_best_move can answer those replies at once.
+        The searches also fill the transposition table for the rest.
+        """
+        # Ordering the replies mustn't add to the stats of the search
+        # get_best_move has already logged
+        self.stats = SearchStats()
+        sim_board = SimulateGame.from_snapshot(snapshot)
+        opp = self.opponent.id
+        replies = self.generate_moves(opp, sim_board)
+        predicted = self.predicted_move(sim_board, opp)
+        for _, reply in self.order_moves(replies, opp, sim_board, 1, predicted):
+            if self.stop_event.is_set():
+                break
+            sim_board.do(reply)
+            if not sim_board.game_over(self.id):
+                # A stopped search leaves its board in the middle of a line
+                found = self.search(SimulateGame.from_snapshot(sim_board.snapshot()), time_budget_ms)
+                # A stopped search may not have reached the usual depth
+                if found is not None and not self.stop_event.is_set():
+                    self.pondered[sim_board.encode(self.id)] = found
+            sim_board.undo(reply)
+        log.debug("Pondered %d replies", len(self.pondered))
 
+    def predicted_move(self, sim_board, curr_player):
+        """Best move for curr_player the transposition table knows, or None."""
+        if AI_Player.CANONICAL_TT:
+            key, symmetry = sim_board.canonical_key(curr_player)
+            key = mix(key, 0)
+        else:
+            key, symmetry = sim_board.key(curr_player), 0
+        entry = self.tt.probe(key)
+        if entry is None or entry[4] is None:
+            return None
+        if symmetry:
+            return SimulateGame.transform_move(entry[4], SimulateGame.symmetry_inverse[symmetry])
+        return entry[4]
+
+    def search_async(self, time_budget_ms=None):
+        """Run get_best_move on a background thread.
+
+        Returns a concurrent.futures.Future for the move, so a game loop can
+        keep drawing and poll done(). The search keeps this player's
+        transposition table and history, so it runs on a thread rather than
+        in another process. Pondering is stopped first.
+        """
+        self.stop_pondering()
+        self.clear_stop()
+        return self.submit(self.find_best_move, time_budget_ms)
+
+    def ponder_async(self, time_budget_ms=None):
+        """Start pondering the current position, with the opponent to move,
+        on the background thread. Returns a Future like search_async.
+        """
+        self.stop_pondering()
+        self.clear_stop()
+        sim_board = SimulateGame(p1_id = self.opponent.id, p2_id = self.id)
+        sim_board.set_state(self.board, player1 = self.opponent, player2 = self)
+        self.pondered = {}
+        self.ponder_future = self.submit(self.ponder, sim_board.snapshot(), time_budget_ms)
+        return self.ponder_future
+
+    def stop_pondering(self):
+        # Wait for it, searches share the transposition table
+        if self.ponder_future is not None:
+            self.stop_search()
+            self.ponder_future.result()
+            self.ponder_future = None
+
+    def submit(self, fn, *args):
+        if self.search_thread is None:
+            self.search_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search")
+        return self.search_thread.submit(fn, *args)
+
+    def stop_search(self):
+        """Make a running search return its best move so far."""
+        if self.cancel is not None:
+            self.cancel.set()
+        self.stop_event.set()
+
+    def clear_stop(self):
+        """Forget stop_search, before a new search starts."""
+        if self.cancel is not None:
+            self.cancel.clear()
+        self.stop_event.clear()
+
+    def search_root(self, sim_board, moves, depth):
+        """Score every root move with a depth ply search. Returns {move: score}.
+
+        The root window only excludes moves that are worse than the best one
+        found so far, so moves that tie for best keep their exact score.
+        """
+        opp = sim_board.get_opponent(self.id)
+        scores = {}
+        alpha = MININT
         for move in moves:
             sim_board.do(move)
-            move.score += self.alpha_beta(opp, sim_board, AI_Player.DEPTH, MININT, MAXINT)
-
-            if move.score > max_score:
-                max_score = move.score
-                
-            if move.score not in scored_moves:
-                scored_moves[move.score] = []
-            
-            scored_moves[move.score].append(move)
-
-            sim_board.undo(move)
-        if scored_moves[max_score]:
-            return random.choice(scored_moves[max_score])
+            try:
+                score = self.alpha_beta(opp, sim_board, depth, alpha, MAXINT)
+            finally:
+                sim_board.undo(move)
+            scores[move] = score
+            if AI_Player.PRUNING:
+                alpha = max(alpha, score - 1)
+        return scores
+
+    def search_root_parallel(self, sim_board, moves, depth):
+        """search_root spread over a pool of self.workers processes.
+
+        The first (best ordered) move is searched on its own to get a bound,
+        then all other moves are searched in parallel with the same root
+        window search_root would end up using. Every task starts from a
+        snapshot of the position. The workers search with this player's
+        endgame_db and batch evaluation (the opening book is only used at
+        the root) and keep their transposition tables for the whole
+        search, like search_root does. With a seed set they start every
+        search from an empty table. stop_search reaches the workers through
+        self.cancel.
+        """
+        if self.executor is None:
+            self.cancel = multiprocessing.Event()
+            if self.stop_event.is_set():
+                self.cancel.set()
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                initargs=(self.cancel,))
+        snapshot = sim_board.snapshot()
+        config = (self.endgame_db.directory if self.endgame_db else None, self.batch_eval is not None)
+
+        def submit(i, alpha):
+            return self.executor.submit(_search_root_move, snapshot, self.id, moves[i], depth, alpha, self.deadline,
+                                        config, self.searches, self.seed is not None)
+
+        results = [submit(0, MININT).result()]
+        alpha = results[0][0] - 1 if AI_Player.PRUNING and results[0][0] is not None else MININT
+        results.extend(future.result() for future in [submit(i, alpha) for i in range(1, len(moves))])
+
+        for _, stats in results:
+            self.stats.merge(stats)
+        if any(score is None for score, _ in results):
+            raise SearchTimeout()
+        return {move: score for move, (score, _) in zip(moves, results)}
+
+    def new_search(self):
+        """Age what earlier searches learned before a new one."""
+        self.tt.new_search()
+        self.killers = [[None, None] for _ in range(AI_Player.MAX_DEPTH + 2)]
+        self.history = {key: value // 2 for key, value in self.history.items() if value > 1}
+
+    def reset(self):
+        """Forget everything learned in earlier searches."""
+        self.tt.clear()
+        self.killers = [[None, None] for _ in range(AI_Player.MAX_DEPTH + 2)]
+        self.history = {}
+
+    def close(self):
+        if self.search_thread is not None:
+            self.stop_search()
+            self.search_thread.shutdown()
+            self.ponder_future = None
+            self.search_thread = None
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+            self.cancel = None
+
+    @staticmethod
+    def endgame_score(value):
+        """Score of an endgame table value (see endgame_db) for the side to
+        move. Quicker wins and slower losses score higher.
+        """
+        if not value:
+            return 0
+        elif value < 128:
+            return AI_Player.MAX_SCORE - value
         else:
-            return None            
+            return -AI_Player.MAX_SCORE + (value - 128)
 
-    def alpha_beta(self, curr_player, sim_board, depth, alpha, beta):
-        self.calls['alpha_beta'] += 1
+    def alpha_beta(self, curr_player, sim_board, depth, alpha, beta, ply=1):
+        stats = self.stats
+        stats.nodes += 1
+        if self.deadline is not None and not stats.nodes & 1023 and (
+                time.monotonic() > self.deadline or self.stop_event.is_set()):
+            raise SearchTimeout()
         opp = sim_board.get_opponent(self.id)
-        
+
+        if self.endgame_db and sim_board.num_placed[opp] == sim_board.num_placed[self.id] == MAX_NUM_PIECES:
+            value = self.endgame_db.probe(sim_board.bitboards[curr_player], sim_board.bitboards[sim_board.get_opponent(curr_player)])
+            if value is not None:
+                stats.endgame_hits += 1
+                score = self.endgame_score(value)
+                return score if curr_player == self.id else -score
+
         if depth == 0:
-            self.calls['evaluate'] += 1
+            stats.evaluations += 1
             return sim_board.evaluate(self.id)
         elif sim_board.game_over(opp):
             return AI_Player.MAX_SCORE
         elif sim_board.game_over(self.id):
             return -AI_Player.MAX_SCORE
         else:
+            tt_move = None
+            if AI_Player.TRANSPOSITION:
+                if AI_Player.CANONICAL_TT:
+                    key, symmetry = sim_board.canonical_key(curr_player)
+                    # Spread the keys over the table, their low bits are mostly zero
+                    key = mix(key, 0)
+                else:
+                    key, symmetry = sim_board.key(curr_player), 0
+                stats.tt_probes += 1
+                entry = self.tt.probe(key)
+                if entry is not None:
+                    stats.tt_hits += 1
+                    _, tt_depth, flag, score, tt_move, _ = entry
+                    if symmetry and tt_move is not None:
+                        tt_move = SimulateGame.transform_move(tt_move, SimulateGame.symmetry_inverse[symmetry])
+                    if tt_depth >= depth and (flag == TranspositionTable.EXACT or
+                                              flag == TranspositionTable.LOWER and score >= beta or
+                                              flag == TranspositionTable.UPPER and score <= alpha):
+                        stats.tt_cutoffs += 1
+                        return score
+
             moves = self.generate_moves(curr_player, sim_board)
             if not moves and curr_player == self.id:
                 return -AI_Player.MAX_SCORE
             elif not moves and curr_player != self.id:
                 return AI_Player.MAX_SCORE
 
-            for move in moves:
-                sim_board.do(move)
-                if curr_player == self.id: #  Maximizing
-                    alpha = max(alpha, self.alpha_beta(opp, sim_board, depth - 1, alpha, beta))
+            leaf_scores = None
+            if depth == 1 and self.batch_eval is not None and not (
+                    self.endgame_db and min(sim_board.num_placed.values()) >= MAX_NUM_PIECES - 1):
+                scores = self.batch_eval.evaluate_moves(sim_board, curr_player, moves).tolist()
+                sign = 1 if self.id == sim_board.p1_id else -1
+                leaf_scores = {move: sign * score for move, score in zip(moves, scores)}
 
-                    if beta <= alpha and AI_Player.PRUNING:
-                        self.calls['pruned'] += 1
-                        sim_board.undo(move)
-                        break
+            alpha_orig, beta_orig = alpha, beta
+            best_move = None
+            for i, (order, move) in enumerate(self.order_moves(moves, curr_player, sim_board, ply, tt_move)):
+                if leaf_scores is not None:
+                    stats.evaluations += 1
+                    score = leaf_scores[move]
+                else:
+                    sim_board.do(move)
+                    score = self.alpha_beta(sim_board.get_opponent(curr_player), sim_board, depth - 1, alpha, beta, ply + 1)
+                    sim_board.undo(move)
+
+                if curr_player == self.id: #  Maximizing
+                    if score > alpha or best_move is None:
+                        alpha = max(alpha, score)
+                        best_move = move
                 else: #  Minimizing
-                    beta = min(beta, self.alpha_beta(self.id, sim_board, depth - 1, alpha, beta))
+                    if score < beta or best_move is None:
+                        beta = min(beta, score)
+                        best_move = move
 
-                    if beta <= alpha and AI_Player.PRUNING:
-                        self.calls['pruned'] += 1
-                        sim_board.undo(move)
-                        break
-                sim_board.undo(move)
+                if beta <= alpha and AI_Player.PRUNING:
+                    stats.pruned += 1
+                    self.record_cutoff(move, order, i, ply, depth)
+                    break
 
             if curr_player == self.id:
-                return alpha
+                result = alpha
+                if alpha >= beta:
+                    flag = TranspositionTable.LOWER
+                elif alpha <= alpha_orig:
+                    flag = TranspositionTable.UPPER
+                else:
+                    flag = TranspositionTable.EXACT
+            else:
+                result = beta
+                if beta <= alpha:
+                    flag = TranspositionTable.UPPER
+                elif beta >= beta_orig:
+                    flag = TranspositionTable.LOWER
+                else:
+                    flag = TranspositionTable.EXACT
+
+            if AI_Player.TRANSPOSITION:
+                if symmetry and best_move is not None:
+                    best_move = SimulateGame.transform_move(best_move, symmetry)
+                self.tt.store(key, depth, flag, result, best_move)
+            return result
+
+    def order_moves(self, moves, curr_player, sim_board, ply, tt_move=None):
+        """Sort moves so the ones most likely to cause a cutoff come first.
+
+        Returns (order, move) pairs, best first. The top bits of order say
+        why a move was put where it is (see ORDER_KINDS): the transposition
+        table move, then mill-closing moves, then moves onto a point where
+        the opponent would close a mill, then this ply's killer moves and
+        finally everything else by history score.
+        """
+        if not AI_Player.ORDERING:
+            return [(0, move) for move in moves]
+
+        threats = sim_board.mill_threats(sim_board.get_opponent(curr_player))
+        killers = self.killers[ply] if AI_Player.KILLERS and ply < len(self.killers) else ()
+        history = self.history if AI_Player.HISTORY else {}
+        shift = AI_Player.ORDER_SHIFT
+
+        ordered = []
+        for move in moves:
+            if move == tt_move:
+                order = 4 << shift
+            elif move & NO_REMOVE != NO_REMOVE:
+                order = 3 << shift
+            elif (threats >> (move & NODE_MASK)) & 1:
+                order = 2 << shift
+            elif move in killers:
+                order = (1 << shift) + (1 if move == killers[0] else 0)
             else:
-                return beta
+                order = history.get(move & HISTORY_MASK, 0)
+            ordered.append((order, move))
+
+        ordered.sort(key=lambda x: x[0], reverse=True)
+        return ordered
+
+    def record_cutoff(self, move, order, index, ply, depth):
+        kind = AI_Player.ORDER_KINDS[min(order >> AI_Player.ORDER_SHIFT, 4)]
+        stats = self.stats
+        stats.cutoffs[kind] = stats.cutoffs.get(kind, 0) + 1
+        stats.cutoffs_by_ply[ply] = stats.cutoffs_by_ply.get(ply, 0) + 1
+        if index == 0:
+            stats.cutoff_first += 1
+
+        if move & NO_REMOVE == NO_REMOVE and kind != 'tt':
+            if ply < len(self.killers) and self.killers[ply][0] != move:
+                self.killers[ply][1] = self.killers[ply][0]
+                self.killers[ply][0] = move
+            history_key = move & HISTORY_MASK
+            self.history[history_key] = self.history.get(history_key, 0) + depth * depth
 
     def generate_remove_moves(self, sim_board, move, opp, opp_mills):
-        moves = []
-        opp_pieces = sim_board.get_pieces()[opp]
-        for rnode, rplayer in sim_board.board.items():
-            if rplayer == opp and (rnode not in opp_mills or len(opp_mills) == len(opp_pieces)):
-                moves.append(move.clone().set_remove(rnode))
-        return moves
+        opp_pieces = sim_board.bitboards[opp]
+        removable = opp_pieces & ~opp_mills or opp_pieces
+        move &= ~NO_REMOVE
+        return [move | rnode << REMOVE_SHIFT for rnode in iter_bits(removable)]
 
     def generate_moves(self, curr_player, sim_board):
-        self.calls['generate_moves'] += 1
+        """Legal moves for curr_player as packed ints."""
         moves = []
         opp = sim_board.get_opponent(curr_player)
         phase = sim_board.get_phase(curr_player)
+        pieces = sim_board.bitboards[curr_player]
+        empty = ~(pieces | sim_board.bitboards[opp]) & SimulateGame.full_mask
+
         if phase == Phase.PLACING:
-            for node, player in sim_board.board.items():
-                if sim_board.is_empty(node):
-                    move = Move(curr_player, Phase.PLACING, dest=node)
-                    sim_board.do(move)
-                    mills = sim_board.get_mills()
-                    if node in mills[curr_player]:
-                        moves.extend(self.generate_remove_moves(sim_board, move, opp, mills[opp]))
-                    else:
-                        moves.append(move)
-                    sim_board.undo(move)
+            candidates = [(None, dest) for dest in iter_bits(empty)]
         elif phase == Phase.MOVING:
-            for node, player in sim_board.board.items():
-                if player == curr_player:
-                    for neighbor in SimulateGame.neighbors[node].values():
-                        if neighbor and sim_board.is_empty(neighbor):
-                            move = Move(curr_player, Phase.MOVING, node, neighbor)
-                            sim_board.do(move)
-                            mills = sim_board.get_mills()
-                            if neighbor in mills[curr_player]:
-                                moves.extend(self.generate_remove_moves(sim_board, move, opp, mills[opp]))
-                            else:
-                                moves.append(move)
-                            sim_board.undo(move)
-        elif phase == Phase.FLYING:
-            for src_node, src_player in sim_board.board.items():
-                if src_player == curr_player:
-                    for dest_node, dest_player in sim_board.board.items():
-                        if sim_board.is_empty(dest_node):
-                            move = Move(curr_player, Phase.MOVING, src_node, dest_node)
-                            sim_board.do(move)
-                            mills = sim_board.get_mills()
-                            if dest_node in mills[curr_player]:
-                                moves.extend(self.generate_remove_moves(sim_board, move, opp, mills[opp]))
-                            else:
-                                moves.append(move)
-                            sim_board.undo(move)
+            neighbor_masks = SimulateGame.neighbor_masks
+            candidates = [(src, dest) for src in iter_bits(pieces) for dest in iter_bits(neighbor_masks[src] & empty)]
+        else:
+            candidates = [(src, dest) for src in iter_bits(pieces) for dest in iter_bits(empty)]
 
+        flags = (PLACING_FLAG if phase == Phase.PLACING else 0) | (P2_FLAG if curr_player == sim_board.p2_id else 0)
+        opp_mills = None
+        for src, dest in candidates:
+            move = flags | (NO_SRC if src is None else src << SRC_SHIFT) | dest
+            if sim_board.closes_mill(curr_player, dest, src):
+                if opp_mills is None:
+                    opp_mills = sim_board.get_mill_mask(opp)
+                moves.extend(self.generate_remove_moves(sim_board, move, opp, opp_mills))
+            else:
+                moves.append(move | NO_REMOVE)
+
+        stats = self.stats
+        stats.generate_moves += 1
+        stats.expanded[phase.name] = stats.expanded.get(phase.name, 0) + 1
+        stats.moves[phase.name] = stats.moves.get(phase.name, 0) + len(moves)
         return moves
+
+_worker_searcher = None
+_worker_endgame_dbs = {}
+_worker_cancel = None
+
+def _init_worker(cancel):
+    # The multiprocessing.Event AI_Player.stop_search sets
+    global _worker_cancel
+    _worker_cancel = cancel
+
+def _worker(ai_id, config):
+    # The process's searcher, set up like the player with config
+    global _worker_searcher
+    if _worker_searcher is None or _worker_searcher.id != ai_id or _worker_searcher.config != config:
+        endgame_dir, batch_eval = config
+        searcher = AI_Player("Worker", ai_id, None, None)
+        if endgame_dir:
+            from endgame_db import EndgameDB  # endgame_db imports this module
+            if endgame_dir not in _worker_endgame_dbs:
+                _worker_endgame_dbs[endgame_dir] = EndgameDB(endgame_dir)
+            searcher.endgame_db = _worker_endgame_dbs[endgame_dir]
+        searcher.batch_eval = BatchEvaluator() if batch_eval and np is not None else None
+        if _worker_cancel is not None:
+            searcher.stop_event = _worker_cancel
+        searcher.config = config
+        searcher.search_id = None
+        _worker_searcher = searcher
+    return _worker_searcher
+
+def _search_root_move(snapshot, ai_id, move, depth, alpha, deadline, config, search_id, fresh):
+    """Process pool task for AI_Player.search_root_parallel: score one root
+    move, a packed int.
+
+    config is (endgame_db directory, batch evaluation on). search_id tells
+    the tasks of one search apart from the next one's; the worker starts a
+    new search on its searcher when it changes, from an empty
+    transposition table if fresh is set. Returns (score, stats) where score
+    is None if the deadline passed and stats is the SearchStats of this
+    move.
+    """
+    searcher = _worker(ai_id, config)
+    if searcher.search_id != search_id:
+        searcher.search_id = search_id
+        if fresh:
+            searcher.reset()
+        else:
+            searcher.new_search()
+    searcher.stats = SearchStats()
+
+    sim_board = SimulateGame.from_snapshot(snapshot)
+    sim_board.do(move)
+    searcher.deadline = deadline
+    try:
+        score = searcher.alpha_beta(sim_board.get_opponent(ai_id), sim_board, depth, alpha, MAXINT)
+    except SearchTimeout:
+        score = None
+    finally:
+        searcher.deadline = None
+    return score, searcher.stats
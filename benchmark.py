@@ -0,0 +1,212 @@
+"""Engine benchmark over a fixed corpus of positions.
+
+Every position in the corpus is searched to its depth with a fresh,
+seeded AI_Player, one depth at a time, so the node counts and best moves
+are reproducible and only the timings vary between runs. The report has
+nodes/s, time to each depth, the SearchStats, peak memory and
+whether the best move agrees with the baseline. Timings take the fastest
+of --repeat runs of CPU time.
+
+    python benchmark.py --save-baseline     # record benchmarks/baseline.json
+    python benchmark.py                     # compare against it
+
+Corpus positions are JSON objects:
+
+    {"name": "midgame-9v8", "label": "midgame", "to_move": 2, "depth": 5,
+     "p1": ["a7", ...], "p2": ["g7", ...], "p1_placed": 9, "p2_placed": 9}
+
+p1 and p2 are the nodes of each side's pieces, *_placed how many pieces
+each side has placed so far (the pieces on the board by default).
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+import tracemalloc
+
+from board import Phase
+from ai_player import AI_Player, SimulateGame, Move
+
+log = logging.getLogger(__name__)
+
+CORPUS_FILE = 'benchmarks/positions.json'
+BASELINE_FILE = 'benchmarks/baseline.json'
+SEED = 0
+TOLERANCE = 0.15
+
+
+def load_corpus(path=CORPUS_FILE):
+    with open(path) as f:
+        return json.load(f)
+
+
+def position_board(position):
+    """SimulateGame for a corpus position, with the side to move in the p2
+    slot the way AI_Player.get_best_move sets up its board.
+    """
+    mover = position['to_move']
+    other = 1 if mover == 2 else 2
+    SimulateGame.init_cls()
+    bits = {p_id: sum(1 << SimulateGame.node_index[name] for name in position['p%d' % p_id]) for p_id in (1, 2)}
+    placed = {p_id: position.get('p%d_placed' % p_id, len(position['p%d' % p_id])) for p_id in (1, 2)}
+    return SimulateGame.from_snapshot((other, mover, bits[other], bits[mover], placed[other], placed[mover]))
+
+
+def move_name(move, sim_board):
+    """Readable name of a packed move: d6, a7-a4 or a7-a4xg1."""
+    move = Move.unpack(move, sim_board)
+    name = move.dest_name if move.phase == Phase.PLACING else '%s-%s' % (move.src_name, move.dest_name)
+    if move.remove is not None:
+        name += 'x' + move.remove_name
+    return name
+
+
+def search(position, depth):
+    """Search a position to depth with a fresh engine. Returns the engine,
+    the (packed move, score) AI_Player.search found and the CPU time the
+    search took.
+    """
+    sim_board = position_board(position)
+    engine = AI_Player("Bench", position['to_move'], None, None, seed=SEED)
+    engine.depth = depth
+    start = time.process_time()
+    found = engine.search(sim_board)
+    return engine, found, time.process_time() - start
+
+
+def bench_position(position, repeat=3, memory=True):
+    """Benchmark one corpus position. Returns its result record."""
+    depth = position['depth']
+    time_to_depth = {}
+    for d in range(1, depth + 1):
+        best = None
+        for _ in range(repeat):
+            engine, found, elapsed = search(position, d)
+            best = elapsed if best is None else min(best, elapsed)
+        time_to_depth[d] = round(best * 1000, 3)
+
+    nodes = engine.stats.nodes
+    result = {
+        'label': position.get('label'),
+        'depth': depth,
+        'best': move_name(found[0], position_board(position)) if found else None,
+        'score': found[1] if found else None,
+        'nodes': nodes,
+        'time_ms': time_to_depth[depth],
+        'nodes_per_sec': round(nodes / (time_to_depth[depth] / 1000)) if time_to_depth[depth] else None,
+        'time_to_depth_ms': time_to_depth,
+        'stats': engine.stats.as_dict(),
+    }
+
+    if memory:
+        # tracemalloc slows the search down, so it gets a run of its own
+        tracemalloc.start()
+        search(position, depth)
+        result['peak_kb'] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        tracemalloc.stop()
+    return result
+
+
+def run_benchmark(corpus, repeat=3, memory=True, labels=None):
+    """Benchmark every corpus position, or those with one of labels.
+    Returns {'positions': {name: result}, 'labels': {label: totals}}.
+    """
+    positions = {}
+    for position in corpus:
+        if labels and position.get('label') not in labels:
+            continue
+        positions[position['name']] = result = bench_position(position, repeat=repeat, memory=memory)
+        log.info("%-16s depth %d: %8d nodes in %9.1f ms, %6d nodes/s, best %s", position['name'], result['depth'],
+                 result['nodes'], result['time_ms'], result['nodes_per_sec'] or 0, result['best'])
+
+    totals = {}
+    for result in positions.values():
+        total = totals.setdefault(result['label'], {'nodes': 0, 'time_ms': 0})
+        total['nodes'] += result['nodes']
+        total['time_ms'] += result['time_ms']
+    for total in totals.values():
+        total['time_ms'] = round(total['time_ms'], 3)
+        total['nodes_per_sec'] = round(total['nodes'] / (total['time_ms'] / 1000)) if total['time_ms'] else None
+    return {'positions': positions, 'labels': totals}
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Differences of results against a baseline run.
+
+    Returns (regressions, notes). Regressions are best moves that changed
+    and positions that got slower than tolerance allows. Node counts that
+    changed and positions that got faster are only notes.
+    """
+    regressions, notes = [], []
+    agree = total = 0
+    for name, result in results['positions'].items():
+        old = baseline['positions'].get(name)
+        if old is None:
+            notes.append("%s: not in the baseline" % name)
+            continue
+        total += 1
+        if result['best'] == old['best']:
+            agree += 1
+        else:
+            regressions.append("%s: best move %s, was %s" % (name, result['best'], old['best']))
+        if result['nodes'] != old['nodes']:
+            notes.append("%s: %d nodes, was %d (%+.1f%%)" % (name, result['nodes'], old['nodes'],
+                                                              100 * (result['nodes'] / old['nodes'] - 1)))
+        if old['time_ms'] and result['time_ms'] > old['time_ms'] * (1 + tolerance):
+            regressions.append("%s: %.1f ms, was %.1f ms (%+.1f%%)" % (name, result['time_ms'], old['time_ms'],
+                                                                      100 * (result['time_ms'] / old['time_ms'] - 1)))
+        elif old['time_ms'] and result['time_ms'] < old['time_ms'] * (1 - tolerance):
+            notes.append("%s: %.1f ms, was %.1f ms (%+.1f%%)" % (name, result['time_ms'], old['time_ms'],
+                                                                100 * (result['time_ms'] / old['time_ms'] - 1)))
+        if 'peak_kb' in result and 'peak_kb' in old and result['peak_kb'] > old['peak_kb'] * (1 + tolerance):
+            notes.append("%s: peak memory %.0f KB, was %.0f KB" % (name, result['peak_kb'], old['peak_kb']))
+    if total:
+        notes.append("best move agreement: %d/%d" % (agree, total))
+    return regressions, notes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the engine on a fixed corpus of positions.")
+    parser.add_argument('--corpus', default=CORPUS_FILE, help="JSON file of positions")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="results to compare against")
+    parser.add_argument('--save-baseline', action='store_true', help="write the results as the new baseline")
+    parser.add_argument('--out', default=None, help="also write the results to this JSON file")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per depth, the fastest counts")
+    parser.add_argument('--label', action='append', help="only positions with this label, can be repeated")
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc run")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help="allowed slowdown before a regression")
+    args = parser.parse_args()
+
+    logging.basicConfig(level="INFO")
+    logging.getLogger('board').setLevel(logging.WARNING)
+
+    results = run_benchmark(load_corpus(args.corpus), repeat=args.repeat, memory=not args.no_memory,
+                            labels=args.label)
+    for label, total in results['labels'].items():
+        log.info("%-8s %9d nodes in %9.1f ms, %6d nodes/s", label, total['nodes'], total['time_ms'],
+                 total['nodes_per_sec'] or 0)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=1)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=1)
+        log.info("Saved the baseline to %s", args.baseline)
+        return 0
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        log.warning("No baseline at %s, run with --save-baseline first", args.baseline)
+        return 0
+    regressions, notes = compare(results, baseline, tolerance=args.tolerance)
+    for note in notes:
+        log.info(note)
+    for regression in regressions:
+        log.warning("Regression: %s", regression)
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
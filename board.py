@@ -93,6 +93,10 @@ class Player:
         self.id: int = id
         self.board: "Board" = board
         self.pieces: Dict[int, Piece] = {x: Piece(x, self) for x in range(MAX_NUM_PIECES)}
+        self.moves_cache = None
+        self.moves_version = None
+        self.any_move_cache = None
+        self.any_move_version = None
         log.info("Player created: %s", str(self))
 
     def __repr__(self) -> str:
@@ -121,7 +125,14 @@ class Player:
         return False
 
     def valid_moves(self):
-        """  documentation placeholder """
+        """Names of the nodes the player can put a piece on this turn.
+
+        The set is cached until the board or the players hand changes, so
+        don't modify it.
+        """
+        version = (self.board.version, len(self.pieces))
+        if self.moves_version == version:
+            return self.moves_cache
         moves = set()
         phase = self.get_phase()
         if phase == Phase.PLACING or phase == Phase.FLYING:
@@ -134,12 +145,27 @@ class Player:
                 for neighbor_node in node.neighbors():
                     if neighbor_node.is_empty():
                         moves.add(neighbor_node.name)
+        self.moves_cache, self.moves_version = moves, version
         return moves
 
+    def has_any_move(self):
+        """Like bool(valid_moves()) but stops at the first legal move."""
+        version = (self.board.version, len(self.pieces))
+        if self.moves_version == version:
+            return bool(self.moves_cache)
+        if self.any_move_version != version:
+            if self.get_phase() == Phase.MOVING:
+                nodes = (neighbor for piece in self.get_placed_pieces() for neighbor in piece.node.neighbors())
+            else:
+                nodes = self.board.board.values()
+            self.any_move_cache = any(node.is_empty() for node in nodes)
+            self.any_move_version = version
+        return self.any_move_cache
+
     def remove_piece(self, piece):
         # remove this players piece
         if piece.player is self:
-            if (piece in self.get_placed_pieces() and 
+            if (self.board.has_piece(piece) and 
                 (piece in self.get_removable_pieces() or
                 not self.get_removable_pieces())):
                 return self.board.remove_piece(piece)
@@ -154,11 +180,10 @@ class Player:
         return False
         
     def get_placed_pieces(self):
-        placed = []
-        for piece in self.board.get_pieces():
-            if piece.player is self:
-                placed.append(piece)
-        return placed
+        return self.board.get_player_pieces(self)
+
+    def count_placed_pieces(self):
+        return self.board.count_pieces(self)
 
     def get_mills(self):
         return [x for x in self.board.get_mills() if x.player is self]
@@ -169,16 +194,16 @@ class Player:
     def get_phase(self):
         if self.pieces:
             return Phase.PLACING
-        elif not self.pieces and len(self.get_placed_pieces()) > MIN_NUM_PIECES:
+        elif not self.pieces and self.count_placed_pieces() > MIN_NUM_PIECES:
             return Phase.MOVING
-        elif not self.pieces and len(self.get_placed_pieces()) <= MIN_NUM_PIECES:
+        elif not self.pieces and self.count_placed_pieces() <= MIN_NUM_PIECES:
             return Phase.FLYING
 
     def can_fly(self):
         return self.get_phase() == Phase.FLYING
 
     def can_move(self):
-        return len(self.valid_moves()) > 0 
+        return self.has_any_move()
 
     
 class Board:
@@ -186,6 +211,15 @@ class Board:
     
     Attributes:
         board: Dictionary of nodes that represents the board. key: Node name
+        lines: The 16 lines of three nodes that form a mill
+        mill_lines: Lines currently filled by a single player
+        mills: Pieces that are part of a mill
+        last_formed_mills: Lines that the last placed or moved piece
+            turned into a mill, cleared by a removal
+        placed_pieces: Pieces on the board per player. key: Player, value:
+            Dict of pieces by id
+        version: Bumped on every change to the board, so anything derived
+            from it can be cached until it changes
     """
     node_map = {
         'a7': ['d7','a4'], 'd7': ['g7','d6'], 'g7': ['g4'],
@@ -200,6 +234,14 @@ class Board:
 
     def __init__(self):
         self.board: Dict[str, Node] = self.create_board()
+        self.lines: List[tuple] = self.create_lines()
+        self.node_lines: Dict[str, List[tuple]] = {name: [line for line in self.lines if node in line]
+                                                   for name, node in self.board.items()}
+        self.mill_lines = set()
+        self.mills = set()
+        self.last_formed_mills: List[tuple] = []
+        self.placed_pieces: Dict["Player", Dict[int, Piece]] = {}
+        self.version: int = 0
 
     def create_board(self):
         board: Dict[str, Node] = {}
@@ -220,6 +262,34 @@ class Board:
                     neigh_node.north = node
         return board
 
+    def create_lines(self):
+        lines = []
+        for node in self.board.values():
+            # Every line starts at its west or north end
+            if not node.west and node.east:
+                lines.append((node, node.east, node.east.east))
+            if not node.north and node.south:
+                lines.append((node, node.south, node.south.south))
+        return lines
+
+    def update_mills(self, node: Node):
+        """Recheck the lines through a node that just changed.
+
+        Returns:
+            Lines through the node that became a mill
+        """
+        formed = []
+        for line in self.node_lines[node.name]:
+            a, b, c = line
+            if a.piece and b.piece and c.piece and a.piece.player is b.piece.player is c.piece.player:
+                if line not in self.mill_lines:
+                    self.mill_lines.add(line)
+                    formed.append(line)
+            else:
+                self.mill_lines.discard(line)
+        self.mills = {n.piece for line in self.mill_lines for n in line}
+        return formed
+
     def place_piece(self, piece: Piece, location: str) -> bool:
         """Place a piece on the board
 
@@ -228,6 +298,13 @@ class Board:
         Returns:
             True if able to successfully place the piece on the board otherwise False
         """
+        if self.put_piece(piece, location):
+            self.last_formed_mills = self.update_mills(piece.node)
+            return True
+        return False
+
+    def put_piece(self, piece: Piece, location: str) -> bool:
+        # Occupy the node without updating the mills
         if location not in self.board:
             log.error("Piece cannot be placed. Invalid location: %s.", location)
             return False
@@ -235,6 +312,8 @@ class Board:
         if node.is_empty():
             piece.node = node
             node.piece = piece
+            self.placed_pieces.setdefault(piece.player, {})[piece.id] = piece
+            self.version += 1
             log.info("Piece placed @ %s", location)
             return True
         log.info("Piece cannot be placed. Occupied by: %s.", str(node.piece))
@@ -243,56 +322,43 @@ class Board:
     def remove_piece(self, piece: Piece):
         node = piece.node
         node.piece = None
+        del self.placed_pieces[piece.player][piece.id]
+        self.version += 1
+        self.update_mills(node)
+        # The removal used up the mill that allowed it
+        self.last_formed_mills = []
         return True
 
     def move_piece(self, piece: Piece, location: str):
         node = piece.node
-        if self.place_piece(piece, location):
+        if self.put_piece(piece, location):
             node.piece = None
+            # The old node first, a line through both nodes is no mill
+            self.update_mills(node)
+            self.last_formed_mills = self.update_mills(piece.node)
             return True
         return False
 
     def get_pieces(self):
-        pieces = []
-        for node in self.board.values():
-            if node.is_occupied():
-                pieces.append(node.piece)
-        return pieces
+        return [piece for pieces in self.placed_pieces.values() for piece in pieces.values()]
+
+    def get_player_pieces(self, player: "Player") -> List[Piece]:
+        return list(self.placed_pieces.get(player, {}).values())
+
+    def count_pieces(self, player: "Player") -> int:
+        return len(self.placed_pieces.get(player, ()))
+
+    def has_piece(self, piece: Piece) -> bool:
+        return self.placed_pieces.get(piece.player, {}).get(piece.id) is piece
 
     def get_nodes(self):
         return list(self.board.values())
 
     def get_mills(self):
-        def is_same_player(a, b, c):
-            try:
-                result = a.piece.player == b.piece.player and b.piece.player == c.piece.player
-            except AttributeError:
-                result = False
-            return result
-                
-        mills = set()
-        for curr in self.get_nodes():
-            east = curr.east
-            east_east = east.east if east else None
-
-            west = curr.west
-            west_west = west.west if west else None
-
-            north = curr.north
-            north_north = north.north if north else None
-            
-            south = curr.south
-            south_south = south.south if south else None
-
-            if (is_same_player(curr, east, east_east) or 
-                is_same_player(curr, west, west_west) or 
-                is_same_player(curr, east, west) or 
-                is_same_player(curr, north, north_north) or 
-                is_same_player(curr, south, south_south) or 
-                is_same_player(curr, north, south)):
-                mills.add(curr.piece)
-
-        return mills
+        """Pieces that are part of a mill. Kept up to date by place_piece,
+        move_piece and remove_piece, so don't modify the returned set.
+        """
+        return self.mills
 
 
 def main():
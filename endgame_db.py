@@ -0,0 +1,319 @@
+"""Endgame tables for positions with few pieces, solved by retrograde analysis.
+
+A material class (a, b) holds every position after the placing phase where
+the side to move has a pieces and the other side b. Each position gets one
+byte:
+
+    0           draw (or not solved)
+    1..127      side to move wins in that many plies
+    128..255    side to move loses in (value - 128) plies
+
+Positions are indexed by ranking the side to move's pieces among the 24
+nodes and the other side's pieces among the remaining 24 - a nodes, so a
+table has exactly C(24, a) * C(24 - a, b) entries. Tables are stored as
+DENSE table_file tables and memory mapped when loaded.
+
+Build tables offline, smallest material first:
+
+    python endgame_db.py --max-pieces 3 --out endgame_db
+"""
+import argparse
+import logging
+import os
+import time
+from collections import defaultdict
+from itertools import combinations
+from math import comb
+
+from board import MIN_NUM_PIECES
+from ai_player import SimulateGame, iter_bits
+from table_file import TableFile, write_dense, DENSE
+
+log = logging.getLogger(__name__)
+
+DRAW = 0
+LOSS = 128
+MAX_DISTANCE = 127
+NUM_NODES = 24
+
+
+def is_win(value):
+    return 0 < value < LOSS
+
+
+def is_loss(value):
+    return value >= LOSS
+
+
+def distance(value):
+    return value - LOSS if value >= LOSS else value
+
+
+def class_size(a, b):
+    return comb(NUM_NODES, a) * comb(NUM_NODES - a, b)
+
+
+def class_file(directory, a, b):
+    return os.path.join(directory, '%dv%d.db' % (a, b))
+
+
+def position_index(stm, opp, b):
+    """Index of a position in its material class table.
+
+    stm and opp are the bitboards of the side to move and the other side.
+    b is the number of pieces of the other side.
+    """
+    result = 0
+    i = 1
+    pieces = stm
+    while pieces:
+        low = pieces & -pieces
+        result += comb(low.bit_length() - 1, i)
+        i += 1
+        pieces ^= low
+
+    result *= comb(NUM_NODES + 1 - i, b)
+    i = 1
+    pieces = opp
+    while pieces:
+        low = pieces & -pieces
+        node = low.bit_length() - 1 - (stm & (low - 1)).bit_count()
+        result += comb(node, i)
+        i += 1
+        pieces ^= low
+    return result
+
+
+def _all_positions(a, b):
+    for stm_nodes in combinations(range(NUM_NODES), a):
+        stm = sum(1 << n for n in stm_nodes)
+        free = [n for n in range(NUM_NODES) if not (stm >> n) & 1]
+        for opp_nodes in combinations(free, b):
+            yield stm, sum(1 << n for n in opp_nodes)
+
+
+def _closes_mill(pieces, dest):
+    for line in SimulateGame.node_mills[dest]:
+        if pieces & line == line:
+            return True
+    return False
+
+
+def _targets(src, count, empty):
+    # Players with three pieces fly, everyone else moves to a neighbor
+    if count <= MIN_NUM_PIECES:
+        return empty
+    return SimulateGame.neighbor_masks[src] & empty
+
+
+def _mill_mask(pieces):
+    mask = 0
+    for line in SimulateGame.mills:
+        if pieces & line == line:
+            mask |= line
+    return mask
+
+
+class EndgameDB:
+    """Solved material classes loaded from a directory of table files."""
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.tables = {}
+        if directory and os.path.isdir(directory):
+            for name in os.listdir(directory):
+                a, _, b = os.path.splitext(name)[0].partition('v')
+                if name.endswith('.db') and a.isdigit() and b.isdigit():
+                    self.load(directory, int(a), int(b))
+
+    def load(self, directory, a, b):
+        table = TableFile(class_file(directory, a, b))
+        if table.kind != DENSE or table.params != [a, b] or len(table) != class_size(a, b):
+            table.close()
+            raise ValueError("%s is not a %dv%d endgame table" % (class_file(directory, a, b), a, b))
+        if (a, b) in self.tables:
+            self.tables[(a, b)].close()
+        self.tables[(a, b)] = table
+        log.info("Loaded %dv%d endgame table", a, b)
+
+    def __bool__(self):
+        return bool(self.tables)
+
+    def has_class(self, a, b):
+        return (a, b) in self.tables
+
+    def probe(self, stm, opp):
+        """Value byte for the position, or None if its class isn't loaded."""
+        b = opp.bit_count()
+        table = self.tables.get((stm.bit_count(), b))
+        if table is None:
+            return None
+        return table[position_index(stm, opp, b)]
+
+
+class _Solver:
+    """Retrograde analysis of the classes (a, b) and (b, a) together.
+
+    Moves that don't capture only lead from one of the two classes to the
+    other. Captures lead to a class with less material, which must already
+    be in solved, or end the game when the other side drops below three
+    pieces.
+    """
+
+    def __init__(self, a, b, solved):
+        self.solved = solved
+        self.classes = [(a, b)] if a == b else [(a, b), (b, a)]
+        self.values = {c: bytearray(class_size(*c)) for c in self.classes}
+        self.counters = {c: bytearray(class_size(*c)) for c in self.classes}
+        self.max_win = {c: bytearray(class_size(*c)) for c in self.classes}
+        self.pending_win = {c: bytearray(class_size(*c)) for c in self.classes}
+        self.buckets = defaultdict(list)
+
+    def push(self, cls, index, value):
+        self.buckets[distance(value)].append((cls, index, value))
+
+    def initialise(self, cls):
+        a, b = cls
+        counters, max_win, pending_win = self.counters[cls], self.max_win[cls], self.pending_win[cls]
+        full = SimulateGame.full_mask
+        for stm, opp in _all_positions(a, b):
+            index = position_index(stm, opp, b)
+            empty = full & ~(stm | opp)
+            internal, external_draw, best_win, worst_loss = 0, False, 0, 0
+            removable = None
+            for src in iter_bits(stm):
+                for dest in iter_bits(_targets(src, a, empty)):
+                    moved = stm ^ (1 << src) | (1 << dest)
+                    if not _closes_mill(moved, dest):
+                        internal += 1
+                        continue
+
+                    if removable is None:
+                        removable = opp & ~_mill_mask(opp) or opp
+                    for remove in iter_bits(removable):
+                        left = opp ^ (1 << remove)
+                        if b - 1 < MIN_NUM_PIECES:
+                            value = LOSS
+                        else:
+                            value = self.solved.probe(left, moved)
+                        if is_loss(value):
+                            if not best_win or distance(value) + 1 < best_win:
+                                best_win = distance(value) + 1
+                        elif is_win(value):
+                            worst_loss = max(worst_loss, value)
+                        else:
+                            external_draw = True
+
+            if best_win:
+                pending_win[index] = min(best_win, MAX_DISTANCE)
+                self.push(cls, index, pending_win[index])
+            elif not internal and not external_draw:
+                self.push(cls, index, LOSS + min(worst_loss + 1, MAX_DISTANCE) if worst_loss else LOSS)
+            else:
+                counters[index] = internal + (1 if external_draw else 0)
+                max_win[index] = worst_loss
+
+    def predecessors(self, cls, stm, opp):
+        """Positions in the other class that reach (stm, opp) without a capture."""
+        b, a = cls  # the side that just moved has a pieces
+        prev_cls = (a, b)
+        empty = SimulateGame.full_mask & ~(stm | opp)
+        for dest in iter_bits(opp):
+            if _closes_mill(opp, dest):
+                continue
+            for src in iter_bits(_targets(dest, a, empty)):
+                before = opp ^ (1 << dest) | (1 << src)
+                yield prev_cls, position_index(before, stm, b)
+
+    def solve(self):
+        for cls in self.classes:
+            start = time.monotonic()
+            self.initialise(cls)
+            log.info("Initialised %dv%d (%d positions) in %.0f s", cls[0], cls[1], class_size(*cls), time.monotonic() - start)
+
+        d = 0
+        while self.buckets:
+            bucket = self.buckets.pop(d, [])
+            for cls, index, value in bucket:
+                values = self.values[cls]
+                if values[index]:
+                    continue
+                values[index] = value
+                stm, opp = self.position(cls, index)
+                for prev_cls, prev in self.predecessors(cls, stm, opp):
+                    if self.values[prev_cls][prev]:
+                        continue
+                    if is_loss(value):
+                        pending = self.pending_win[prev_cls]
+                        if not pending[prev] or pending[prev] > d + 1:
+                            pending[prev] = min(d + 1, MAX_DISTANCE)
+                            self.push(prev_cls, prev, pending[prev])
+                    elif not self.pending_win[prev_cls][prev]:
+                        counters, max_win = self.counters[prev_cls], self.max_win[prev_cls]
+                        max_win[prev] = max(max_win[prev], value)
+                        counters[prev] -= 1
+                        if not counters[prev]:
+                            self.push(prev_cls, prev, LOSS + min(max_win[prev] + 1, MAX_DISTANCE))
+            d += 1
+        return self.values
+
+    def position(self, cls, index):
+        # Bitboards for a table index, the inverse of position_index
+        a, b = cls
+        size = comb(NUM_NODES - a, b)
+        stm_rank, opp_rank = divmod(index, size)
+        stm = _unrank(stm_rank, a)
+        free = [n for n in range(NUM_NODES) if not (stm >> n) & 1]
+        opp = sum(1 << free[n] for n in iter_bits(_unrank(opp_rank, b)))
+        return stm, opp
+
+
+def _unrank(rank, k):
+    # Inverse of the combinatorial ranking used by position_index
+    result = 0
+    n = NUM_NODES
+    for i in range(k, 0, -1):
+        while comb(n, i) > rank:
+            n -= 1
+        result |= 1 << n
+        rank -= comb(n, i)
+    return result
+
+
+def solve_classes(max_pieces, directory):
+    """Solve every class where both sides have MIN_NUM_PIECES..max_pieces
+    pieces and write the tables to directory, smallest material first.
+    """
+    SimulateGame.init_cls()
+    os.makedirs(directory, exist_ok=True)
+    solved = EndgameDB(directory)
+    counts = range(MIN_NUM_PIECES, max_pieces + 1)
+    pairs = sorted({tuple(sorted((a, b), reverse=True)) for a in counts for b in counts}, key=lambda x: (sum(x), x))
+    for a, b in pairs:
+        if solved.has_class(a, b) and solved.has_class(b, a):
+            log.info("%dv%d already solved", a, b)
+            continue
+        start = time.monotonic()
+        for (x, y), table in _Solver(a, b, solved).solve().items():
+            write_dense(class_file(directory, x, y), table, params=(x, y))
+            solved.load(directory, x, y)
+            wins = sum(1 for v in table if is_win(v))
+            losses = sum(1 for v in table if is_loss(v))
+            log.info("%dv%d: %d wins, %d losses, %d draws", x, y, wins, losses, len(table) - wins - losses)
+        log.info("Solved %dv%d in %.0f s", a, b, time.monotonic() - start)
+    return solved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve low-material endgames by retrograde analysis.")
+    parser.add_argument('--max-pieces', type=int, default=MIN_NUM_PIECES,
+                        help="solve all classes where both sides have at most this many pieces")
+    parser.add_argument('--out', default='endgame_db', help="directory for the table files")
+    args = parser.parse_args()
+
+    logging.basicConfig(level="INFO")
+    logging.getLogger('board').setLevel(logging.WARNING)
+    solve_classes(args.max_pieces, args.out)
+
+if __name__ == '__main__':
+    main()
@@ -14,6 +14,60 @@ Y_OFFSET_PLAYER = 70
 RADIUS = 20
 CHOICE_WIDTH = 225
 CHOICE_HEIGHT = 150
+TEXT_CACHE_SIZE = 256
+
+_fonts = {}
+_images = {}
+_texts = {}
+_circles = {}
+
+
+def get_font(path, size):
+    """Font loaded from disk once per path and size."""
+    key = (path, size)
+    if key not in _fonts:
+        _fonts[key] = pygame.font.Font(path, size)
+    return _fonts[key]
+
+
+def get_image(path):
+    """Image loaded from disk once per path."""
+    if path not in _images:
+        _images[path] = pygame.image.load(path)
+    return _images[path]
+
+
+def render_text(path, size, text, color):
+    """Rendered text, cached until TEXT_CACHE_SIZE different texts were
+    rendered. Don't draw on the returned surface.
+    """
+    key = (path, size, text, tuple(color))
+    surface = _texts.get(key)
+    if surface is None:
+        if len(_texts) >= TEXT_CACHE_SIZE:
+            _texts.clear()
+        surface = _texts[key] = get_font(path, size).render(text, True, color)
+    return surface
+
+
+def circle_sprite(r, color, outline=None):
+    """Anti-aliased circle on a transparent surface, drawn once per radius
+    and colors. Its center is at (r, r).
+    """
+    key = (r, tuple(color), tuple(outline) if outline else None)
+    if key not in _circles:
+        # gfxdraw doesn't blend onto transparent pixels, so every circle is
+        # drawn on its own surface and the surfaces are blitted together
+        sprite = pygame.Surface((2 * r + 1, 2 * r + 1), pygame.SRCALPHA)
+        circles = [(r, outline), (r - 2, color)] if outline else [(r, color)]
+        for radius, circle_color in circles:
+            circle = pygame.Surface(sprite.get_size(), pygame.SRCALPHA)
+            pygame.gfxdraw.aacircle(circle, r, r, radius, circle_color)
+            pygame.gfxdraw.filled_circle(circle, r, r, radius, circle_color)
+            sprite.blit(circle, (0, 0))
+        _circles[key] = sprite
+    return _circles[key]
+
 
 class Choice:
     def __init__(self, choice1, choice2):
@@ -31,12 +85,12 @@ class Choice:
         tmp = surface.copy()
         pygame.draw.rect(tmp, pygame.Color('#4996E3'), self.choice_1_rect)
         pygame.draw.rect(tmp, pygame.Color('#FFFFFF'), self.choice_1_rect, 4)
-        text = pygame.font.Font('assets/GameCube.ttf', 12).render(self.choice_text_1, True, pygame.Color('#FFFFFF'))
+        text = render_text('assets/GameCube.ttf', 12, self.choice_text_1, pygame.Color('#FFFFFF'))
         tmp.blit(text, text.get_rect(center=self.choice_1_rect.center))
 
         pygame.draw.rect(tmp, pygame.Color('#4996E3'), self.choice_2_rect)
         pygame.draw.rect(tmp, pygame.Color('#FFFFFF'), self.choice_2_rect, 4)
-        text = pygame.font.Font('assets/GameCube.ttf', 12).render(self.choice_text_2, True, pygame.Color('#FFFFFF'))
+        text = render_text('assets/GameCube.ttf', 12, self.choice_text_2, pygame.Color('#FFFFFF'))
         tmp.blit(text, text.get_rect(center=self.choice_2_rect.center))
         fade_in = (self.frame / (self.fade_in_sec * 60)) * 178.5
         if self.frame < (self.fade_in_sec * 60):
@@ -69,6 +123,7 @@ class Gui:
             self.r = int(r)
             self.color = color
             self.outline = outline
+            self.index = None
 
         @property
         def v(self):
@@ -78,21 +133,75 @@ class Gui:
         def xy(self):
             return (self.x, self.y)
 
+        @property
+        def sprite(self):
+            return circle_sprite(self.r, self.color, self.outline)
+
+        @property
+        def rect(self):
+            return pygame.Rect(self.x - self.r, self.y - self.r, 2 * self.r + 1, 2 * self.r + 1)
+
         def draw(self, surface):
-            if self.outline:
-                bg_circ_def = (surface, self.x, self.y, self.r, self.outline)
-                pygame.gfxdraw.aacircle(*bg_circ_def)
-                pygame.gfxdraw.filled_circle(*bg_circ_def)
-            circ_def = (surface, self.x, self.y, (self.r - 2) if self.outline else self.r, self.color)
-            pygame.gfxdraw.aacircle(*circ_def)
-            pygame.gfxdraw.filled_circle(*circ_def)
+            surface.blit(self.sprite, (self.x - self.r, self.y - self.r))
 
         def distance_to(self, vector):
             return self.v.distance_to(vector)
 
         def move(self, x, y):
-            self.x = int(x)
-            self.y = int(y)
+            if self.index is not None:
+                self.index.move(self, x, y)
+            else:
+                self.x = int(x)
+                self.y = int(y)
+
+
+    class HitIndex:
+        """Circles bucketed by the TILESIZE cells of the board grid that
+        their hit area touches, so finding the circles under a point only
+        looks at one cell. Also maps the model objects to their circles.
+        The grid continues past the board, off-board circles are indexed
+        the same way.
+        """
+        def __init__(self, model):
+            self.model = model
+            self.cells = {}
+            self.circles = {}
+
+        @staticmethod
+        def cell(x, y):
+            return ((int(x) - X_OFFSET) // TILESIZE, (int(y) - Y_OFFSET) // TILESIZE)
+
+        def circle_cells(self, circle):
+            col1, row1 = self.cell(circle.x - RADIUS, circle.y - RADIUS)
+            col2, row2 = self.cell(circle.x + RADIUS, circle.y + RADIUS)
+            return [(col, row) for col in range(col1, col2 + 1) for row in range(row1, row2 + 1)]
+
+        def add(self, circle):
+            circle.index = self
+            self.circles[self.model(circle)] = circle
+            for cell in self.circle_cells(circle):
+                self.cells.setdefault(cell, []).append(circle)
+
+        def remove(self, circle):
+            circle.index = None
+            del self.circles[self.model(circle)]
+            for cell in self.circle_cells(circle):
+                self.cells[cell].remove(circle)
+
+        def move(self, circle, x, y):
+            self.remove(circle)
+            circle.x = int(x)
+            circle.y = int(y)
+            self.add(circle)
+
+        def find(self, model):
+            return self.circles.get(model)
+
+        def at(self, vector):
+            """First circle whose hit area holds the point, or None."""
+            for circle in self.cells.get(self.cell(*vector), ()):
+                if circle.distance_to(vector) <= RADIUS:
+                    return circle
 
 
     class Node(Circle):
@@ -105,7 +214,7 @@ class Gui:
 
         def draw(self, surface):
             super().draw(surface)
-            text = pygame.font.Font('assets/GameCube.ttf', 12).render(self.node.name, True, pygame.Color('#dddddd'))
+            text = render_text('assets/GameCube.ttf', 12, self.node.name, pygame.Color('#dddddd'))
             surface.blit(text, text.get_rect(center=self.v))
 
         def move(self, *args, **kwargs):
@@ -122,8 +231,11 @@ class Gui:
 
 
     class Board:
+        """The board drawing. Nothing on it moves, so it is rendered once
+        into surface and blitted every frame.
+        """
         def __init__(self, board):
-            self.surface = pygame.Surface(WIN_SIZE)
+            self.surface = None
             self.board = board
             self.nodes = None
             self.edges = None
@@ -147,24 +259,29 @@ class Gui:
                     neighbor_x, neighbor_y = calc_node_center(neighbor.name)
                     self.edges.append(Gui.Line(x, y, neighbor_x, neighbor_y))
         
-        def draw(self, screen):
-            self.surface.fill(pygame.Color('#dddddd'))
-            self.surface.blit(pygame.image.load('assets/background.png'), (0,0))
+        def render(self):
+            surface = pygame.Surface(WIN_SIZE)
+            surface.fill(pygame.Color('#dddddd'))
+            surface.blit(get_image('assets/background.png'), (0,0))
 
-            font48 = pygame.font.Font('assets/GameCube.ttf', 48)
+            font48 = get_font('assets/GameCube.ttf', 48)
             
             title = font48.render("Nine men's morris", True, pygame.Color('#ffffff'))
             title_shadow = font48.render("Nine men's morris", True, pygame.Color('#7a8a9a'))
             
-            self.surface.blit(title_shadow, title_shadow.get_rect(center=(WIN_SIZE[0]//2, 24)).move(2, 2))
-            self.surface.blit(title, title.get_rect(center=(WIN_SIZE[0]//2, 24)))
+            surface.blit(title_shadow, title_shadow.get_rect(center=(WIN_SIZE[0]//2, 24)).move(2, 2))
+            surface.blit(title, title.get_rect(center=(WIN_SIZE[0]//2, 24)))
 
             for edge in self.edges:
-                edge.draw(self.surface)
+                edge.draw(surface)
                 
             for node in self.nodes.values():
-                node.draw(self.surface)
+                node.draw(surface)
+            return surface
 
+        def draw(self, screen):
+            if self.surface is None:
+                self.surface = self.render()
             screen.blit(self.surface, (0, 0))
 
 
@@ -182,6 +299,7 @@ class Gui:
 
             self.player = player
             self.pieces = {}
+            self.placemat = None
             self.create()
 
         def create(self):
@@ -195,16 +313,24 @@ class Gui:
                 self.pieces[piece_id] = Gui.Piece(x, y, self.color, piece)
 
         def remove_piece(self, piece_id):
-            del self.pieces[piece_id]
+            piece = self.pieces.pop(piece_id)
+            if piece.index is not None:
+                piece.index.remove(piece)
 
         def draw(self, screen):
-            font48 = pygame.font.Font('assets/GameCube.ttf', 48)
-            placemat = font48.render(self.player.name, True, pygame.Color('#cccccc'))
-            placemat = pygame.transform.rotate(placemat, self.placemat_degree)
-            screen.blit(placemat, placemat.get_rect(center=(self.placemat_x_calc(self, placemat.get_width()), WIN_SIZE[1] // 2 + Y_OFFSET_PLAYER // 2)))
-            
+            for surface, rect in self.layers():
+                screen.blit(surface, rect)
+
+        def layers(self):
+            """(surface, rect) of the placemat and every piece, bottom first."""
+            if self.placemat is None:
+                placemat = get_font('assets/GameCube.ttf', 48).render(self.player.name, True, pygame.Color('#cccccc'))
+                self.placemat = pygame.transform.rotate(placemat, self.placemat_degree)
+            placemat = self.placemat
+            yield placemat, placemat.get_rect(center=(self.placemat_x_calc(self, placemat.get_width()), WIN_SIZE[1] // 2 + Y_OFFSET_PLAYER // 2))
+
             for piece in self.pieces.values():
-                piece.draw(screen)
+                yield piece.sprite, piece.rect
         
 
     def __init__(self, board, player1, player2):
@@ -212,28 +338,27 @@ class Gui:
         self.players = {1: Gui.Player(1, player1), 2: Gui.Player(2, player2)}
         self.screen = pygame.display.set_mode(WIN_SIZE)
         self.choice = None
-
-    def find_piece(self, find_me):
+        self.nodes = Gui.HitIndex(lambda node: node.node)
+        for node in self.board.nodes.values():
+            self.nodes.add(node)
+        self.pieces = Gui.HitIndex(lambda piece: piece.piece)
         for player in self.players.values():
             for piece in player.pieces.values():
-                if piece.piece is find_me:
-                    return piece
+                self.pieces.add(piece)
+        # What render put on the screen, None to repaint everything
+        self.drawn = None
+
+    def find_piece(self, find_me):
+        return self.pieces.find(find_me)
 
     def find_node(self, find_me):
-        for node in self.board.nodes.values():
-            if node.node is find_me:
-                return node
+        return self.nodes.find(find_me)
 
     def get_piece(self, vector):
-        for player in self.players.values():
-            for piece in player.pieces.values():
-                if piece.distance_to(vector) <= RADIUS:
-                    return piece
+        return self.pieces.at(vector)
 
     def get_node(self, vector):
-        for node in self.board.nodes.values():
-            if node.distance_to(vector) <= RADIUS:
-                return node
+        return self.nodes.at(vector)
 
     def tell(self, vector):
         result = [self.get_node(vector), self.get_piece(vector)]
@@ -250,14 +375,62 @@ class Gui:
             player.draw(self.screen)
 
     def game_message(self, *args):
-        font = pygame.font.Font('assets/Monoid-Bold.ttf', 18)
-        text = font.render(', '.join([m for m in args if m]), True, pygame.Color('#4996E3'))
-        self.screen.blit(text, text.get_rect(center=(WIN_SIZE[0]//2, text.get_height()//2 + Y_OFFSET - text.get_height() * 2)))
+        self.screen.blit(*self.game_message_layer(args))
 
     def debug_message(self, *args):
-        font = pygame.font.Font('assets/Monoid-Regular.ttf', 12)
-        text = font.render(', '.join([m for m in args if m]), True, pygame.Color('#aaaaaa'))
-        self.screen.blit(text, text.get_rect(center=(WIN_SIZE[0]//2, WIN_SIZE[1] - text.get_height()//2)))
+        self.screen.blit(*self.debug_message_layer(args))
+
+    def game_message_layer(self, args):
+        text = render_text('assets/Monoid-Bold.ttf', 18, ', '.join([m for m in args if m]), pygame.Color('#4996E3'))
+        return text, text.get_rect(center=(WIN_SIZE[0]//2, text.get_height()//2 + Y_OFFSET - text.get_height() * 2))
+
+    def debug_message_layer(self, args):
+        text = render_text('assets/Monoid-Regular.ttf', 12, ', '.join([m for m in args if m]), pygame.Color('#aaaaaa'))
+        return text, text.get_rect(center=(WIN_SIZE[0]//2, WIN_SIZE[1] - text.get_height()//2))
+
+    def render(self, message=(), debug=()):
+        """Draw a frame like draw_board, game_message, draw_pieces and
+        debug_message followed by a display flip, but only repaint the
+        parts that changed since the last render and only update those on
+        the display. message and debug are the arguments for game_message
+        and debug_message.
+
+        Returns the updated rects, empty when nothing changed.
+        """
+        layers = {'message': self.game_message_layer(message)}
+        for player_id, player in self.players.items():
+            for i, layer in enumerate(player.layers()):
+                layers[(player_id, i)] = layer
+        layers['debug'] = self.debug_message_layer(debug)
+
+        if self.drawn is None:
+            dirty = [self.screen.get_rect()]
+        else:
+            dirty = []
+            for key, (surface, rect) in layers.items():
+                old = self.drawn.get(key)
+                if old is None or old[0] is not surface or old[1] != rect:
+                    dirty.append(rect)
+                    if old is not None:
+                        dirty.append(old[1])
+            dirty.extend(rect for key, (_, rect) in self.drawn.items() if key not in layers)
+        self.drawn = layers
+
+        if self.board.surface is None:
+            self.board.surface = self.board.render()
+        for area in dirty:
+            # Repaint the whole area, blending over what is there would
+            # darken the anti-aliased edges
+            self.screen.set_clip(area)
+            self.screen.blit(self.board.surface, area, area)
+            for surface, rect in layers.values():
+                if rect.colliderect(area):
+                    self.screen.blit(surface, rect)
+        self.screen.set_clip(None)
+
+        if dirty:
+            pygame.display.update(dirty)
+        return dirty
              
 
 def main():
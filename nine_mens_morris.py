@@ -4,17 +4,30 @@ import itertools
 
 from board import Node, Piece, Board, Player, Phase, MAX_NUM_PIECES, MIN_NUM_PIECES
 from ai_player import AI_Player
+from endgame_db import EndgameDB
+from opening_book import OpeningBook
 from gui import Gui, Choice, WIN_SIZE
 
 log = logging.getLogger("game_flow")
 logging.basicConfig(level="INFO")
 
+ENDGAME_DB_DIR = 'endgame_db'
+OPENING_BOOK_FILE = 'opening_book.db'
+
+
+def close_ai_players(*players):
+    # Stops pondering and any search still running
+    for player in players:
+        if isinstance(player, AI_Player):
+            player.close()
+
 
 def start_game():
     clock = pygame.time.Clock()
     board = Board()
     turns = 0
     MAX_TURNS = 500
+    AI_TIME_BUDGET_MS = 1000
 
     play_ai = None
     choice = Choice("Human", "Computer")
@@ -58,43 +71,49 @@ def start_game():
     can_remove_piece = False
 
     game_won_by = None
+    ai_search = None
     while True:
         if isinstance(current_player, AI_Player) and not game_won_by:
-            if current_player.get_phase() == Phase.FLYING:
-                AI_Player.DEPTH = 2
-
-            move = current_player.get_best_move()
-            log.info("Move score: %d", move.score)
-            if move.phase == Phase.PLACING:
-                piece = list(current_player.pieces.values())[0] 
-                if current_player.place_piece(piece, move.dest):
-                    node = gui.find_node(board.board[move.dest])
-                    gui.find_piece(piece).move(*node.xy)
-                    log.info("Placed %s", piece)
-                else:
-                    log.critical("AI BROKE. COULD NOT PLACE.")
-            else:
-                piece = board.board[move.src].piece
-                if current_player.move_piece(piece, move.dest):
-                    node = gui.find_node(board.board[move.dest])
-                    gui.find_piece(piece).move(*node.xy)
-                    log.info("Moved %s piece from %s", piece, move.src)
-                else:
-                    log.critical("AI BROKE. COULD NOT MOVE.")
-
-            if move.remove:
-                other_player = next(player_toggle)
-                piece = board.board[move.remove].piece
-                if other_player.remove_piece(piece):
-                    for player in gui.players.values():
-                        if player.player is piece.player:
-                            player.remove_piece(piece.id)
-                    log.info("Computer removed %s piece", piece)
+            # Search on a worker thread so the window keeps drawing
+            if ai_search is None:
+                ai_search = current_player.search_async(time_budget_ms=AI_TIME_BUDGET_MS)
+            elif ai_search.done():
+                move = ai_search.result()
+                ai_search = None
+                log.info("Move score: %d", move.score)
+                if move.phase == Phase.PLACING:
+                    piece = list(current_player.pieces.values())[0] 
+                    if current_player.place_piece(piece, move.dest_name):
+                        node = gui.find_node(board.board[move.dest_name])
+                        gui.find_piece(piece).move(*node.xy)
+                        log.info("Placed %s", piece)
+                    else:
+                        log.critical("AI BROKE. COULD NOT PLACE.")
                 else:
-                    log.critical("AI BROKE. COULD NOT REMOVE.")
-                next(player_toggle) # skip the next cycle to return to normal
-            turns += 1
-            current_player = next(player_toggle)
+                    piece = board.board[move.src_name].piece
+                    if current_player.move_piece(piece, move.dest_name):
+                        node = gui.find_node(board.board[move.dest_name])
+                        gui.find_piece(piece).move(*node.xy)
+                        log.info("Moved %s piece from %s", piece, move.src_name)
+                    else:
+                        log.critical("AI BROKE. COULD NOT MOVE.")
+
+                if move.remove is not None:
+                    other_player = next(player_toggle)
+                    piece = board.board[move.remove_name].piece
+                    if other_player.remove_piece(piece):
+                        for player in gui.players.values():
+                            if player.player is piece.player:
+                                player.remove_piece(piece.id)
+                        log.info("Computer removed %s piece", piece)
+                    else:
+                        log.critical("AI BROKE. COULD NOT REMOVE.")
+                    next(player_toggle) # skip the next cycle to return to normal
+                turns += 1
+                mover, current_player = current_player, next(player_toggle)
+                if not isinstance(current_player, AI_Player):
+                    # Think about the likely replies while the human moves
+                    mover.ponder_async(time_budget_ms=AI_TIME_BUDGET_MS)
 
         events = pygame.event.get()
         mouse_pos = pygame.Vector2(pygame.mouse.get_pos()) 
@@ -102,8 +121,12 @@ def start_game():
         
         for e in events:
             if e.type == pygame.QUIT:
+                close_ai_players(player1, player2)
                 return 0
-            if e.type == pygame.MOUSEBUTTONDOWN and mouse_btns == (1,0,0):
+            if e.type == pygame.KEYDOWN and e.key == pygame.K_ESCAPE and ai_search is not None:
+                # Don't wait for the time budget, play the best move so far
+                current_player.stop_search()
+            if e.type == pygame.MOUSEBUTTONDOWN and mouse_btns == (1,0,0) and ai_search is None:
                 selected_piece = gui.get_piece(mouse_pos)
                 if selected_piece:
                     log.info("%s piece picked up", selected_piece)
@@ -150,7 +173,7 @@ def start_game():
             if not action_succesful:
                 prev_selected_piece.move(*prev_selected_piece_pos)
             else:
-                if prev_selected_piece.piece in current_player.get_mills():
+                if board.last_formed_mills:
                     can_remove_piece = True
                 else:
                     current_player = next(player_toggle)
@@ -159,22 +182,25 @@ def start_game():
         
         if turns >= MAX_TURNS or \
            not player1.can_move() and not player2.can_move() and \
-           not player1.pieces and len(player1.get_placed_pieces()) < MIN_NUM_PIECES and \
-           not player2.pieces and len(player2.get_placed_pieces()) < MIN_NUM_PIECES:
+           not player1.pieces and player1.count_placed_pieces() < MIN_NUM_PIECES and \
+           not player2.pieces and player2.count_placed_pieces() < MIN_NUM_PIECES:
             game_won_by = "TIE! Everyone"
-        elif not player1.can_move() or not player1.pieces and len(player1.get_placed_pieces()) < MIN_NUM_PIECES:
+        elif not player1.can_move() or not player1.pieces and player1.count_placed_pieces() < MIN_NUM_PIECES:
             game_won_by = player2
-        elif not player2.can_move() or not player2.pieces and len(player2.get_placed_pieces()) < MIN_NUM_PIECES:
+        elif not player2.can_move() or not player2.pieces and player2.count_placed_pieces() < MIN_NUM_PIECES:
             game_won_by = player1
 
-        gui.draw_board()
         if game_won_by:
-            gui.game_message("%s WON!" % (game_won_by))
+            message = "%s WON!" % (game_won_by)
+        elif ai_search is not None:
+            message = "%s is thinking... (Esc to move now)" % (current_player)
         elif not can_remove_piece:
-            gui.game_message("%s turn" % (current_player))
+            message = "%s turn" % (current_player)
         else:
-            gui.game_message("%s remove piece from other player." % (current_player))
+            message = "%s remove piece from other player." % (current_player)
 
+        if game_won_by is not None:
+            close_ai_players(player1, player2)
         choice = Choice("Quit", "Play new game")
         while game_won_by is not None:
             events = pygame.event.get()
@@ -196,11 +222,14 @@ def start_game():
             pygame.display.flip()
             clock.tick(60)
 
-        gui.draw_pieces()
-        gui.debug_message(str(mouse_pos), gui.tell(mouse_pos))
-        pygame.display.flip()
+        # Only the pieces and messages that changed are repainted
+        gui.render((message,), (str(mouse_pos), gui.tell(mouse_pos)))
         clock.tick(60)
 
 if __name__ == '__main__':
+    # Tables are built offline with endgame_db.py and opening_book.py;
+    # without them the engine just searches
+    AI_Player.ENDGAME_DB = EndgameDB(ENDGAME_DB_DIR)
+    AI_Player.OPENING_BOOK = OpeningBook(OPENING_BOOK_FILE)
     while start_game():
         pass
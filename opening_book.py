@@ -0,0 +1,236 @@
+"""Opening book for the placing phase, built from offline deep searches.
+
+Every position with fewer than --plies pieces placed is searched to --depth
+plies and the moves that score close to the best one are stored with a
+weight, so the engine can answer instantly and still vary its play.
+Positions are keyed by SimulateGame.canonical_key with the side to move
+in the p2 slot, the way AI_Player.get_best_move sets up its board, so one
+entry serves all 16 symmetric variants of a position. The book is a
+HASHED table_file table whose values hold BOOK_MOVES moves of three bytes
+each: dest, remove (NO_NODE for none) and weight (0 for an unused entry).
+
+Build it offline, then point AI_Player.OPENING_BOOK at it:
+
+    python opening_book.py --plies 4 --depth 5 --workers 8 --out opening_book.db
+"""
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from board import MAX_NUM_PIECES
+from ai_player import (AI_Player, SimulateGame, MAXINT, NO_SRC, NODE_MASK, PLACING_FLAG, P2_FLAG,
+                       REMOVE_SHIFT)
+from table_file import TableFile, write_hashed, HASHED
+
+log = logging.getLogger(__name__)
+
+BOOK_MOVES = 4
+MOVE_SIZE = 3
+MARGIN = 4
+MOVER, OTHER = 2, 1
+
+_searcher = None
+
+
+def book_symmetries(sim_board, curr_player):
+    """canonical_key of the position and every symmetry that maps the
+    position onto it. A symmetric position has more than one, and any of
+    them can be used to play a book move.
+    """
+    key, _ = sim_board.canonical_key(curr_player)
+    b1, b2 = sim_board.bitboards[sim_board.p1_id], sim_board.bitboards[sim_board.p2_id]
+    board = key & 0xFFFFFFFFFFFF
+    symmetries = [symmetry for symmetry in range(len(SimulateGame.symmetries))
+                  if SimulateGame.transform(b1, symmetry) | SimulateGame.transform(b2, symmetry) << 24 == board]
+    return key, symmetries
+
+
+def canonical_snapshot(sim_board, curr_player):
+    """Snapshot of the position turned by the symmetry canonical_key picks,
+    so the moves searched for it are in the frame of the book key.
+    """
+    _, symmetry = sim_board.canonical_key(curr_player)
+    p1_id, p2_id, p1_bits, p2_bits, p1_placed, p2_placed = sim_board.snapshot()
+    return (p1_id, p2_id, SimulateGame.transform(p1_bits, symmetry), SimulateGame.transform(p2_bits, symmetry),
+            p1_placed, p2_placed)
+
+
+def encode_moves(moves):
+    """Book value for a list of (packed move, weight), best first."""
+    value = bytearray(BOOK_MOVES * MOVE_SIZE)
+    for i, (move, weight) in enumerate(moves[:BOOK_MOVES]):
+        value[i * MOVE_SIZE:(i + 1) * MOVE_SIZE] = bytes([move & NODE_MASK, (move >> REMOVE_SHIFT) & NODE_MASK, weight])
+    return bytes(value)
+
+
+def decode_moves(value, sim_board, curr_player):
+    """(packed move, weight) pairs of a book value, for curr_player on sim_board."""
+    flags = PLACING_FLAG | NO_SRC | (P2_FLAG if curr_player == sim_board.p2_id else 0)
+    moves = []
+    for i in range(0, len(value), MOVE_SIZE):
+        dest, remove, weight = value[i:i + MOVE_SIZE]
+        if weight:
+            moves.append((flags | dest | remove << REMOVE_SHIFT, weight))
+    return moves
+
+
+class OpeningBook:
+    """Book moves for placing phase positions, loaded from a table file."""
+
+    def __init__(self, path=None):
+        self.table = None
+        self.plies = self.depth = 0
+        if path and os.path.isfile(path):
+            table = TableFile(path)
+            if table.kind != HASHED or table.value_size != BOOK_MOVES * MOVE_SIZE:
+                table.close()
+                raise ValueError("%s is not an opening book" % path)
+            self.table = table
+            self.plies, self.depth = table.params
+            log.info("Loaded opening book with %d positions searched to depth %d", len(table), self.depth)
+
+    def __bool__(self):
+        return self.table is not None
+
+    def lookup(self, sim_board, curr_player):
+        """(moves, symmetries) for the position, or None if it isn't in the
+        book. moves are (move, weight) pairs in the canonical frame, and any
+        of symmetries maps the position onto that frame.
+        """
+        if self.table is None or sim_board.num_placed[curr_player] >= MAX_NUM_PIECES:
+            return None
+        key, symmetries = book_symmetries(sim_board, curr_player)
+        value = self.table.lookup(key)
+        if value is None:
+            return None
+        return decode_moves(value, sim_board, curr_player), symmetries
+
+    def probe(self, sim_board, curr_player):
+        """Book moves for the position as (packed move, weight) pairs, []
+        if it isn't in the book.
+        """
+        found = self.lookup(sim_board, curr_player)
+        if found is None:
+            return []
+        moves, symmetries = found
+        inverse = SimulateGame.symmetry_inverse[symmetries[0]]
+        return [(SimulateGame.transform_move(move, inverse), weight) for move, weight in moves]
+
+    def choose(self, sim_board, curr_player, rng):
+        """A packed book move picked at random by weight, or None. In a
+        symmetric position it is also played in a random one of its
+        equivalent ways.
+        """
+        found = self.lookup(sim_board, curr_player)
+        if found is None:
+            return None
+        moves, symmetries = found
+        move = rng.choices([move for move, _ in moves], weights=[weight for _, weight in moves])[0]
+        return SimulateGame.transform_move(move, SimulateGame.symmetry_inverse[rng.choice(symmetries)])
+
+    def close(self):
+        if self.table is not None:
+            self.table.close()
+            self.table = None
+
+
+def book_positions(plies):
+    """Snapshots of every placing phase position with fewer than plies
+    pieces placed, one per canonical key, with the side to move in the p2
+    slot. Every snapshot is in the orientation of its key, see
+    canonical_snapshot. Yields (key, snapshot).
+    """
+    searcher = AI_Player("Book", MOVER, None, None)
+    frontier = {}
+    sim_board = SimulateGame(p1_id=OTHER, p2_id=MOVER)
+    frontier[sim_board.canonical_key(MOVER)[0]] = sim_board.snapshot()
+    for _ in range(plies):
+        next_frontier = {}
+        for key, snapshot in frontier.items():
+            yield key, snapshot
+            sim_board = SimulateGame.from_snapshot(snapshot)
+            for move in searcher.generate_moves(MOVER, sim_board):
+                sim_board.do(move)
+                # The other side moves next, so it takes over the p2 slot
+                _, _, other_bits, mover_bits, other_placed, mover_placed = sim_board.snapshot()
+                child = SimulateGame.from_snapshot((OTHER, MOVER, mover_bits, other_bits, mover_placed, other_placed))
+                sim_board.undo(move)
+                if child.num_placed[MOVER] < MAX_NUM_PIECES:
+                    key = child.canonical_key(MOVER)[0]
+                    if key not in next_frontier:
+                        next_frontier[key] = canonical_snapshot(child, MOVER)
+        frontier = next_frontier
+
+
+def search_position(snapshot, depth):
+    """Search every move of a book position. Returns the book value."""
+    global _searcher
+    if _searcher is None:
+        _searcher = AI_Player("Book", MOVER, None, None)
+    searcher = _searcher
+    searcher.reset()
+
+    sim_board = SimulateGame.from_snapshot(snapshot)
+    moves = searcher.generate_moves(MOVER, sim_board)
+
+    # Symmetric moves lead to the same position, search one of each
+    distinct = {}
+    for _, move in searcher.order_moves(moves, MOVER, sim_board, 0):
+        sim_board.do(move)
+        distinct.setdefault(sim_board.canonical_key(OTHER)[0], move)
+        sim_board.undo(move)
+
+    best = None
+    scored = []
+    for move in distinct.values():
+        # Only moves within MARGIN of the best need an exact score
+        floor = best - MARGIN - 1 if best is not None else -MAXINT
+        sim_board.do(move)
+        score = searcher.alpha_beta(OTHER, sim_board, depth, floor, MAXINT)
+        sim_board.undo(move)
+        if score > floor:
+            scored.append((score, move))
+            best = score if best is None else max(best, score)
+
+    scored.sort(key=lambda x: x[0], reverse=True)
+    book_moves = [(move, MARGIN + 1 - (best - score)) for score, move in scored if best - score <= MARGIN]
+    return encode_moves(book_moves)
+
+
+def build_book(path, plies, depth, workers=1):
+    """Search every position of the first plies placements and write the book."""
+    SimulateGame.init_cls()
+    jobs = list(book_positions(plies))
+    log.info("Searching %d positions to depth %d", len(jobs), depth)
+
+    start = time.monotonic()
+    args = ([snapshot for _, snapshot in jobs], [depth] * len(jobs))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            values = list(executor.map(search_position, *args, chunksize=8))
+    else:
+        values = list(map(search_position, *args))
+    log.info("Searched in %.0f s", time.monotonic() - start)
+
+    items = {key: value for (key, _), value in zip(jobs, values)}
+    write_hashed(path, items, BOOK_MOVES * MOVE_SIZE, params=(plies, depth))
+    return len(items)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build an opening book for the placing phase.")
+    parser.add_argument('--plies', type=int, default=4, help="book positions with fewer pieces placed than this")
+    parser.add_argument('--depth', type=int, default=5, help="search depth for every book position")
+    parser.add_argument('--workers', type=int, default=1, help="processes to spread the searches over")
+    parser.add_argument('--out', default='opening_book.db', help="table file to write")
+    args = parser.parse_args()
+
+    logging.basicConfig(level="INFO")
+    logging.getLogger('board').setLevel(logging.WARNING)
+    count = build_book(args.out, args.plies, args.depth, workers=args.workers)
+    log.info("Wrote %d positions to %s", count, args.out)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Perft: count the positions the move generator reaches to a fixed depth.
+
+Walks the whole move tree of AI_Player.generate_moves (removals included)
+with SimulateGame.do/undo, without any search, so a faster generator can
+be checked move for move against the current one and timed on its own.
+A position where the side to move has lost ends its line and counts as
+nothing below depth 0.
+
+    python perft.py --position midgame-9v8 --depth 4 --divide
+    python perft.py --check                 # compare with benchmarks/perft.json
+
+Positions come from the benchmark corpus. benchmarks/perft.json has the
+counts per position and depth, 1 first. The ones from the empty board are
+plain arithmetic until a mill is possible (24, 24*23, ...), the rest were
+recorded with the current generator.
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+
+from ai_player import AI_Player
+from benchmark import CORPUS_FILE, load_corpus, position_board, move_name
+
+log = logging.getLogger(__name__)
+
+COUNTS_FILE = 'benchmarks/perft.json'
+
+
+def perft(generator, sim_board, curr_player, depth):
+    """Number of move sequences of depth plies from the position."""
+    if depth == 0:
+        return 1
+    if sim_board.game_over(curr_player):
+        return 0
+    moves = generator.generate_moves(curr_player, sim_board)
+    if depth == 1:
+        return len(moves)
+    opp = sim_board.get_opponent(curr_player)
+    count = 0
+    for move in moves:
+        sim_board.do(move)
+        count += perft(generator, sim_board, opp, depth - 1)
+        sim_board.undo(move)
+    return count
+
+
+def divide(generator, sim_board, curr_player, depth):
+    """perft split by root move. Returns {move name: count}."""
+    if depth == 0 or sim_board.game_over(curr_player):
+        return {}
+    opp = sim_board.get_opponent(curr_player)
+    counts = {}
+    for move in generator.generate_moves(curr_player, sim_board):
+        sim_board.do(move)
+        counts[move_name(move, sim_board)] = perft(generator, sim_board, opp, depth - 1)
+        sim_board.undo(move)
+    return counts
+
+
+def run_perft(position, depth):
+    """perft of a corpus position. Returns (count, seconds)."""
+    sim_board = position_board(position)
+    generator = AI_Player("Perft", position['to_move'], None, None)
+    start = time.process_time()
+    count = perft(generator, sim_board, position['to_move'], depth)
+    return count, time.process_time() - start
+
+
+def check(corpus, known, max_depth=None):
+    """Compare perft with the known counts. Returns the mismatches as
+    (position name, depth, count, expected).
+    """
+    positions = {position['name']: position for position in corpus}
+    mismatches = []
+    for name, counts in known.items():
+        for depth, expected in enumerate(counts, 1):
+            if max_depth is not None and depth > max_depth:
+                break
+            count, elapsed = run_perft(positions[name], depth)
+            log.info("%-16s depth %d: %10d %s in %.2f s (%.0f nodes/s)", name, depth, count,
+                     "ok" if count == expected else "expected %d" % expected, elapsed, count / elapsed if elapsed else 0)
+            if count != expected:
+                mismatches.append((name, depth, count, expected))
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count move generator leaf positions to a fixed depth.")
+    parser.add_argument('--corpus', default=CORPUS_FILE, help="JSON file of positions")
+    parser.add_argument('--position', default='opening-empty', help="corpus position to count from")
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--divide', action='store_true', help="count per root move")
+    parser.add_argument('--check', action='store_true', help="compare with the known counts instead")
+    parser.add_argument('--counts', default=COUNTS_FILE, help="JSON file of known counts")
+    parser.add_argument('--max-depth', type=int, default=None, help="deepest known count to check")
+    args = parser.parse_args()
+
+    logging.basicConfig(level="INFO")
+    logging.getLogger('board').setLevel(logging.WARNING)
+    corpus = load_corpus(args.corpus)
+
+    if args.check:
+        with open(args.counts) as f:
+            mismatches = check(corpus, json.load(f), max_depth=args.max_depth)
+        for name, depth, count, expected in mismatches:
+            log.error("%s depth %d: %d, expected %d", name, depth, count, expected)
+        return 1 if mismatches else 0
+
+    position = next(position for position in corpus if position['name'] == args.position)
+    if args.divide:
+        sim_board = position_board(position)
+        generator = AI_Player("Perft", position['to_move'], None, None)
+        for name, count in divide(generator, sim_board, position['to_move'], args.depth).items():
+            print("%s: %d" % (name, count))
+    count, elapsed = run_perft(position, args.depth)
+    print("%s depth %d: %d in %.2f s (%.0f nodes/s)" % (args.position, args.depth, count, elapsed,
+                                                        count / elapsed if elapsed else 0))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
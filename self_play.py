@@ -0,0 +1,187 @@
+"""Headless AI vs AI matches for regression testing the engine.
+
+Plays games between two AI_Player configurations using only the board
+model and the search, without pygame, and appends one JSON line per game:
+
+    python self_play.py --games 1000 --workers 8 --out results.jsonl \
+        --a-depth 3 --b-depth 2
+"""
+import argparse
+import json
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from board import Board, Phase, MIN_NUM_PIECES
+from ai_player import AI_Player
+from endgame_db import EndgameDB
+from opening_book import OpeningBook
+
+log = logging.getLogger(__name__)
+
+MAX_TURNS = 500
+
+_endgame_dbs = {}
+_opening_books = {}
+
+
+def get_winner(player1, player2, turns, max_turns=MAX_TURNS):
+    """Same end of game rules as nine_mens_morris.start_game.
+
+    Returns the winning player, "tie" or None while the game is still going.
+    """
+    if turns >= max_turns or \
+       not player1.can_move() and not player2.can_move() and \
+       not player1.pieces and player1.count_placed_pieces() < MIN_NUM_PIECES and \
+       not player2.pieces and player2.count_placed_pieces() < MIN_NUM_PIECES:
+        return "tie"
+    elif not player1.can_move() or not player1.pieces and player1.count_placed_pieces() < MIN_NUM_PIECES:
+        return player2
+    elif not player2.can_move() or not player2.pieces and player2.count_placed_pieces() < MIN_NUM_PIECES:
+        return player1
+    return None
+
+
+def apply_move(board, player, other_player, move):
+    """Play an AI move on the real board. Returns False if it was rejected."""
+    if move.phase == Phase.PLACING:
+        piece = list(player.pieces.values())[0]
+        if not player.place_piece(piece, move.dest_name):
+            return False
+    else:
+        piece = board.board[move.src_name].piece
+        if not player.move_piece(piece, move.dest_name):
+            return False
+
+    if move.remove is not None:
+        return other_player.remove_piece(board.board[move.remove_name].piece)
+    return True
+
+
+def create_engine(name, id, board, opponent, config, seed):
+    engine = AI_Player(name, id, board, opponent, seed=seed)
+    if config.get('depth'):
+        engine.depth = config['depth']
+    if config.get('endgame_db'):
+        if config['endgame_db'] not in _endgame_dbs:
+            _endgame_dbs[config['endgame_db']] = EndgameDB(config['endgame_db'])
+        engine.endgame_db = _endgame_dbs[config['endgame_db']]
+    if config.get('opening_book'):
+        if config['opening_book'] not in _opening_books:
+            _opening_books[config['opening_book']] = OpeningBook(config['opening_book'])
+        engine.opening_book = _opening_books[config['opening_book']]
+    return engine
+
+
+def play_game(game_id, engine_a, engine_b, a_first=True, seed=None, max_turns=MAX_TURNS):
+    """Play one game between two engine configurations.
+
+    An engine configuration is a dict with an optional 'depth', an
+    optional 'time_ms' budget per move, an optional 'endgame_db'
+    directory and an optional 'opening_book' file. Returns the result record that is written to the JSONL file.
+    """
+    board = Board()
+    first, second = ('a', 'b') if a_first else ('b', 'a')
+    configs = {'a': engine_a, 'b': engine_b}
+    game_seed = None if seed is None else '%s:%d' % (seed, game_id)
+
+    player1 = create_engine(first, 1, board, None, configs[first], game_seed)
+    player2 = create_engine(second, 2, board, player1, configs[second], game_seed)
+    player1.opponent = player2
+    players = [player1, player2]
+
+    start = time.monotonic()
+    move_times_ms = []
+    error = None
+    turns = 0
+    winner = get_winner(player1, player2, turns, max_turns)
+    while winner is None:
+        current_player, other_player = players[turns % 2], players[(turns + 1) % 2]
+        move_start = time.monotonic()
+        move = current_player.get_best_move(time_budget_ms=configs[current_player.name].get('time_ms'))
+        move_times_ms.append(round((time.monotonic() - move_start) * 1000, 3))
+
+        if move is None or not apply_move(board, current_player, other_player, move):
+            # Treat an engine that can't produce a legal move as having lost
+            error = "%s made an illegal move" % current_player.name
+            winner = other_player
+            break
+        turns += 1
+        winner = get_winner(player1, player2, turns, max_turns)
+
+    for player in players:
+        player.close()
+
+    return {
+        'game': game_id,
+        'seed': game_seed,
+        'first': first,
+        'winner': winner if winner == "tie" else winner.name,
+        'plies': turns,
+        'move_times_ms': move_times_ms,
+        'duration_s': round(time.monotonic() - start, 3),
+        'engines': configs,
+        'error': error,
+    }
+
+
+def run_match(games, engine_a, engine_b, out, workers=1, seed=None, swap=True, max_turns=MAX_TURNS):
+    """Play a batch of games and stream each result to out as a JSON line.
+
+    With swap set the engines take turns moving first. Games are spread
+    over workers processes. Returns the number of wins per engine and ties.
+    """
+    tally = {'a': 0, 'b': 0, 'tie': 0}
+    jobs = [(i, engine_a, engine_b, not swap or i % 2 == 0, seed, max_turns) for i in range(games)]
+
+    def record(result):
+        tally[result['winner']] += 1
+        out.write(json.dumps(result) + '\n')
+        out.flush()
+        log.info("Game %d: winner %s after %d plies", result['game'], result['winner'], result['plies'])
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(play_game, *job) for job in jobs]
+            for future in as_completed(futures):
+                record(future.result())
+    else:
+        for job in jobs:
+            record(play_game(*job))
+    return tally
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play AI vs AI games without a window.")
+    parser.add_argument('--games', type=int, default=10, help="number of games to play")
+    parser.add_argument('--workers', type=int, default=1, help="processes to spread the games over")
+    parser.add_argument('--out', default='self_play.jsonl', help="JSONL file the results are appended to")
+    parser.add_argument('--seed', default=None, help="make the games reproducible")
+    parser.add_argument('--max-turns', type=int, default=MAX_TURNS)
+    parser.add_argument('--no-swap', action='store_true', help="engine a always moves first")
+    for engine in ['a', 'b']:
+        parser.add_argument('--%s-depth' % engine, type=int, default=AI_Player.DEPTH)
+        parser.add_argument('--%s-time-ms' % engine, type=int, default=None, help="time budget per move")
+        parser.add_argument('--%s-endgame-db' % engine, default=None, help="directory of endgame tables")
+        parser.add_argument('--%s-opening-book' % engine, default=None, help="opening book file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level="INFO")
+    # The board and engine log every node and piece they create
+    logging.getLogger('board').setLevel(logging.WARNING)
+
+    engine_a = {'depth': args.a_depth, 'time_ms': args.a_time_ms, 'endgame_db': args.a_endgame_db,
+                'opening_book': args.a_opening_book}
+    engine_b = {'depth': args.b_depth, 'time_ms': args.b_time_ms, 'endgame_db': args.b_endgame_db,
+                'opening_book': args.b_opening_book}
+
+    start = time.monotonic()
+    with open(args.out, 'a') as out:
+        tally = run_match(args.games, engine_a, engine_b, out, workers=args.workers, seed=args.seed,
+                          swap=not args.no_swap, max_turns=args.max_turns)
+    elapsed = time.monotonic() - start
+    log.info("a: %d, b: %d, ties: %d in %.1f s (%.0f games/hour)", tally['a'], tally['b'], tally['tie'],
+             elapsed, args.games / elapsed * 3600 if elapsed else 0)
+
+if __name__ == '__main__':
+    main()
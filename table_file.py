@@ -0,0 +1,145 @@
+"""Read-only binary tables that are memory mapped instead of loaded.
+
+Large precomputed tables (endgame results, opening books) are written once
+and then opened with mmap, so every engine process shares the same pages
+and startup costs nothing. Two layouts are supported:
+
+DENSE
+    One fixed size value per index. Used when positions already have a
+    minimal perfect index, like the material class ranking in endgame_db.
+
+HASHED
+    Fixed size values for an arbitrary set of 64 bit position keys (see
+    SimulateGame.encode). The keys are placed with a perfect hash built by
+    hash-and-displace: a key's bucket stores a displacement that sends every
+    key in the bucket to its own slot, so a lookup reads exactly one
+    displacement and one slot.
+
+All integers are little-endian. The file starts with a 64 byte header:
+magic, version, kind, value size, slot count, bucket count and two free
+parameters (the endgame tables store their material class there).
+"""
+import mmap
+import os
+import struct
+
+MAGIC = b'NMMTABLE'
+VERSION = 1
+DENSE = 1
+HASHED = 2
+
+HEADER = struct.Struct('<8sHHIQQII24x')
+KEY = struct.Struct('<Q')
+DISPLACEMENT = struct.Struct('<I')
+MASK64 = (1 << 64) - 1
+BUCKET_SIZE = 4
+LOAD_FACTOR = 0.8
+
+
+def mix(key, seed):
+    """64 bit finalizer (splitmix64) of key combined with seed."""
+    x = (key + (seed + 1) * 0x9E3779B97F4A7C15) & MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+
+def write_dense(path, values, value_size=1, params=(0, 0)):
+    """Write a DENSE table. values is a bytes-like of count * value_size."""
+    if len(values) % value_size:
+        raise ValueError("values is not a whole number of %d byte entries" % value_size)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, DENSE, value_size, len(values) // value_size, 0, *params))
+        f.write(values)
+    os.replace(tmp_path, path)
+
+
+def write_hashed(path, items, value_size, params=(0, 0)):
+    """Write a HASHED table from a {key: value bytes} dict."""
+    keys = list(items)
+    num_buckets = max(1, (len(keys) + BUCKET_SIZE - 1) // BUCKET_SIZE)
+    num_slots = max(1, int(len(keys) / LOAD_FACTOR) + 1)
+
+    buckets = [[] for _ in range(num_buckets)]
+    for key in keys:
+        buckets[mix(key, 0) % num_buckets].append(key)
+
+    displacements = [0] * num_buckets
+    slots = [None] * num_slots
+    # Biggest buckets first, while there is still plenty of room
+    for bucket_index in sorted(range(num_buckets), key=lambda i: len(buckets[i]), reverse=True):
+        bucket = buckets[bucket_index]
+        if not bucket:
+            break
+        displacement = 0
+        while True:
+            displacement += 1
+            taken = [mix(key, displacement) % num_slots for key in bucket]
+            if len(set(taken)) == len(taken) and all(slots[slot] is None for slot in taken):
+                break
+        displacements[bucket_index] = displacement
+        for key, slot in zip(bucket, taken):
+            slots[slot] = key
+
+    empty = bytes(KEY.size + value_size)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, HASHED, value_size, num_slots, num_buckets, *params))
+        f.write(b''.join(DISPLACEMENT.pack(d) for d in displacements))
+        for key in slots:
+            if key is None:
+                f.write(empty)
+            else:
+                value = items[key]
+                if len(value) != value_size:
+                    raise ValueError("value for key %x is not %d bytes" % (key, value_size))
+                # Keys are stored plus one so that an empty slot never matches
+                f.write(KEY.pack((key + 1) & MASK64) + value)
+    os.replace(tmp_path, path)
+
+
+class TableFile:
+    """A memory mapped DENSE or HASHED table."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.kind, self.value_size, self.slots, self.buckets, *self.params = HEADER.unpack_from(self.mm)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("%s is not a version %d table file" % (path, VERSION))
+
+        self.data_offset = HEADER.size
+        if self.kind == HASHED:
+            self.data_offset += self.buckets * DISPLACEMENT.size
+            self.slot_size = KEY.size + self.value_size
+        else:
+            self.slot_size = self.value_size
+
+        if len(self.mm) != self.data_offset + self.slots * self.slot_size:
+            self.close()
+            raise ValueError("%s is truncated" % path)
+
+    def __len__(self):
+        return self.slots
+
+    def __getitem__(self, index):
+        """Value at index of a DENSE table. One byte values come back as int."""
+        if self.value_size == 1:
+            return self.mm[self.data_offset + index]
+        offset = self.data_offset + index * self.value_size
+        return self.mm[offset:offset + self.value_size]
+
+    def lookup(self, key):
+        """Value bytes for key in a HASHED table, or None if it isn't there."""
+        displacement, = DISPLACEMENT.unpack_from(self.mm, HEADER.size + mix(key, 0) % self.buckets * DISPLACEMENT.size)
+        offset = self.data_offset + mix(key, displacement) % self.slots * self.slot_size
+        stored, = KEY.unpack_from(self.mm, offset)
+        if stored != (key + 1) & MASK64:
+            return None
+        return self.mm[offset + KEY.size:offset + self.slot_size]
+
+    def close(self):
+        self.mm.close()
@@ -0,0 +1,500 @@
+import pytest
+import json
+import pstats
+import time
+
+from board import Board, Player, Phase
+from ai_player import AI_Player, SimulateGame, Move, TranspositionTable, move_dest, move_remove
+
+
+def place(player, *locations):
+    for location in locations:
+        player.place_piece(list(player.pieces.values())[0], location)
+
+
+def simulate(board, player1, player2):
+    sim_board = SimulateGame(p1_id=player1.id, p2_id=player2.id)
+    sim_board.set_state(board, player1=player1, player2=player2)
+    return sim_board
+
+
+def test_node_indices_follow_node_map():
+    sim_board = SimulateGame(1, 2)
+    assert SimulateGame.nodes == list(Board.node_map)
+    assert SimulateGame.node_index['a7'] == 0
+    assert len(SimulateGame.mills) == 16
+    assert all(bin(line).count('1') == 3 for line in SimulateGame.mills)
+
+
+def test_set_state_bitboards():
+    board = Board()
+    player1 = Player("Player 1", 1, board)
+    player2 = Player("Player 2", 2, board)
+    place(player1, 'a7', 'd7')
+    place(player2, 'g1')
+
+    sim_board = simulate(board, player1, player2)
+    index = SimulateGame.node_index
+    assert sim_board.bitboards[1] == (1 << index['a7']) | (1 << index['d7'])
+    assert sim_board.bitboards[2] == 1 << index['g1']
+    assert sim_board.num_on_board(1) == 2
+    assert sim_board.num_placed[2] == 1
+    assert sim_board.get_phase(1) == Phase.PLACING
+
+
+def test_do_undo_restores_position():
+    board = Board()
+    player1 = Player("Player 1", 1, board)
+    player2 = Player("Player 2", 2, board)
+    place(player1, 'a7', 'd7')
+    place(player2, 'g1', 'd1')
+
+    sim_board = simulate(board, player1, player2)
+    before = dict(sim_board.bitboards), dict(sim_board.num_placed)
+    index = SimulateGame.node_index
+    move = sim_board.pack_move(1, Phase.PLACING, dest=index['g7'], remove=index['g1'])
+    assert Move.unpack(move, sim_board).remove_name == 'g1'
+    sim_board.do(move)
+    assert sim_board.get_mills()[1] == sim_board.bitboards[1]
+    assert not sim_board.bitboards[2] & (1 << index['g1'])
+    sim_board.undo(move)
+    assert (dict(sim_board.bitboards), dict(sim_board.num_placed)) == before
+
+
+def test_mill_piece_not_removable():
+    board = Board()
+    player1 = Player("Player 1", 1, board)
+    player2 = Player("Player 2", 2, board)
+    place(player1, 'a7', 'd7')
+    place(player2, 'a1', 'd1', 'g1', 'b2')
+
+    sim_board = simulate(board, player1, player2)
+    ai = AI_Player("Computer", 1, board, player2)
+    moves = [Move.unpack(m, sim_board) for m in ai.generate_moves(1, sim_board)]
+    removes = {m.remove_name for m in moves if m.dest_name == 'g7'}
+    assert removes == {'b2'}
+
+
+def test_generate_placing_moves_from_empty_board():
+    board = Board()
+    player1 = Player("Player 1", 1, board)
+    ai = AI_Player("Computer", 2, board, player1)
+    sim_board = simulate(board, player1, ai)
+    assert len(ai.generate_moves(2, sim_board)) == len(Board.node_map)
+
+
+def test_best_move_is_legal():
+    board = Board()
+    player1 = Player("Player 1", 1, board)
+    ai = AI_Player("Computer", 2, board, player1)
+    place(player1, 'a7', 'd7')
+    place(ai, 'd6')
+
+    move = ai.get_best_move()
+    assert move.phase == Phase.PLACING
+    assert move.dest_name == 'g7'
+
+
+def test_closes_mill():
+    board = Board()
+    player1 = Player("Player 1", 1, board)
+    player2 = Player("Player 2", 2, board)
+    place(player1, 'a7', 'd7', 'g4')
+    place(player2, 'a1')
+
+    sim_board = simulate(board, player1, player2)
+    index = SimulateGame.node_index
+    assert all(len(lines) == 2 for lines in SimulateGame.node_mills)
+    assert sim_board.closes_mill(1, index['g7'])
+    assert not sim_board.closes_mill(1, index['g7'], src=index['d7'])
+    assert not sim_board.closes_mill(2, index['g7'])
+    assert sim_board.bitboards[1] & (1 << index['g7']) == 0
+
+
+def test_incremental_hash_matches_full_hash():
+    board = Board()
+    player1 = Player("Player 1", 1, board)
+    ai = AI_Player("Computer", 2, board, player1)
+    place(player1, 'a7', 'd7')
+    place(ai, 'a1', 'd1')
+    sim_board = simulate(board, player1, ai)
+    start = sim_board.hash
+
+    played = []
+    curr_player = 1
+    for _ in range(6):
+        move = ai.generate_moves(curr_player, sim_board)[-1]
+        sim_board.do(move)
+        played.append(move)
+        assert sim_board.hash == sim_board.compute_hash()
+        curr_player = sim_board.get_opponent(curr_player)
+    for move in reversed(played):
+        sim_board.undo(move)
+    assert sim_board.hash == start
+    assert sim_board.key(1) != sim_board.key(2)
+
+
+def test_transposition_table_replacement():
+    tt = TranspositionTable(4)
+    tt.store(1, 5, TranspositionTable.EXACT, 10, None)
+    tt.store(5, 2, TranspositionTable.LOWER, 20, None)
+    assert tt.probe(1)[1] == 5
+    assert tt.probe(5)[3] == 20
+    tt.new_search()
+    tt.store(9, 1, TranspositionTable.UPPER, 30, None)
+    assert tt.probe(1) is None
+    assert tt.probe(9)[2] == TranspositionTable.UPPER
+
+
+def test_best_move_within_time_budget():
+    board = Board()
+    player1 = Player("Player 1", 1, board)
+    ai = AI_Player("Computer", 2, board, player1)
+    place(player1, 'a7', 'd7', 'b4', 'f6', 'c3', 'e3', 'g1', 'd2', 'a1')
+    place(ai, 'g7', 'd5', 'c4')
+    ai.pieces.clear()
+
+    start = time.monotonic()
+    move = ai.get_best_move(time_budget_ms=100)
+    assert move is not None
+    assert time.monotonic() - start < 0.5
+    assert ai.deadline is None
+
+
+def test_order_moves_puts_mills_and_blocks_first():
+    board = Board()
+    player1 = Player("Player 1", 1, board)
+    ai = AI_Player("Computer", 2, board, player1)
+    place(player1, 'a1', 'd1')
+    place(ai, 'a7', 'd7')
+    sim_board = simulate(board, player1, ai)
+
+    ordered = [Move.unpack(move, sim_board) for _, move in ai.order_moves(ai.generate_moves(2, sim_board), 2, sim_board, 1)]
+    assert ordered[0].dest_name == 'g7' and ordered[0].remove is not None
+    assert ordered[2].dest_name == 'g1' and ordered[2].remove is None
+
+    ai.get_best_move()
+    cutoffs = sum(ai.stats.cutoffs.get(kind, 0) for kind in AI_Player.ORDER_KINDS)
+    assert cutoffs == ai.stats.pruned == sum(ai.stats.cutoffs_by_ply.values())
+
+
+def test_snapshot_round_trip():
+    board = Board()
+    player1 = Player("Player 1", 1, board)
+    player2 = Player("Player 2", 2, board)
+    place(player1, 'a7', 'g4')
+    place(player2, 'd2')
+    sim_board = simulate(board, player1, player2)
+
+    copy = SimulateGame.from_snapshot(sim_board.snapshot())
+    assert copy.bitboards == sim_board.bitboards
+    assert copy.num_placed == sim_board.num_placed
+    assert copy.hash == sim_board.hash
+
+
+def test_parallel_search_is_deterministic_with_seed():
+    results = []
+    for _ in range(2):
+        board = Board()
+        player1 = Player("Player 1", 1, board)
+        ai = AI_Player("Computer", 2, board, player1, workers=2, seed=42)
+        place(player1, 'a7', 'd7', 'b4')
+        place(ai, 'd6', 'f4')
+        try:
+            move = ai.get_best_move()
+        finally:
+            ai.close()
+        results.append((move.src, move.dest, move.remove, move.score))
+    assert results[0] == results[1]
+
+
+def test_encode_is_exact():
+    board = Board()
+    player1 = Player("Player 1", 1, board)
+    player2 = Player("Player 2", 2, board)
+    place(player1, 'a7')
+    place(player2, 'g1')
+    sim_board = simulate(board, player1, player2)
+
+    code = sim_board.encode(1)
+    assert code != sim_board.encode(2)
+    assert code & SimulateGame.full_mask == sim_board.bitboards[1]
+    assert (code >> 24) & SimulateGame.full_mask == sim_board.bitboards[2]
+    assert (code >> 48) & 0xF == 1 and (code >> 52) & 0xF == 1
+
+
+def test_init_cls_builds_the_tables_once():
+    SimulateGame.init_cls()
+    nodes, mills = SimulateGame.nodes, list(SimulateGame.mills)
+    SimulateGame.init_cls()
+    assert SimulateGame.nodes is nodes
+    assert SimulateGame.mills == mills and len(mills) == 16
+
+
+def test_symmetries_preserve_mills_and_neighbors():
+    SimulateGame.init_cls()
+    assert len({tuple(perm) for perm in SimulateGame.symmetries}) == 16
+    assert SimulateGame.symmetries[0] == list(range(24))
+    for symmetry, perm in enumerate(SimulateGame.symmetries):
+        mills = sorted(SimulateGame.transform(line, symmetry) for line in SimulateGame.mills)
+        assert mills == sorted(SimulateGame.mills)
+        for node in range(24):
+            assert SimulateGame.transform(SimulateGame.neighbor_masks[node], symmetry) == SimulateGame.neighbor_masks[perm[node]]
+            assert SimulateGame.symmetries[SimulateGame.symmetry_inverse[symmetry]][perm[node]] == node
+
+
+def test_canonical_key_is_shared_by_symmetric_positions():
+    positions = [('a7', 'd7', 'f4'), ('g1', 'd1', 'b4'), ('c5', 'd5', 'f4'), ('a7', 'a4', 'd2')]
+    keys = set()
+    for p1_nodes in positions:
+        board = Board()
+        player1 = Player("Player 1", 1, board)
+        player2 = Player("Player 2", 2, board)
+        place(player1, *p1_nodes)
+        sim_board = simulate(board, player1, player2)
+        key, symmetry = sim_board.canonical_key(2)
+        keys.add(key)
+
+        move = sim_board.pack_move(2, Phase.PLACING, dest=SimulateGame.node_index['g7'])
+        back = SimulateGame.transform_move(SimulateGame.transform_move(move, symmetry), SimulateGame.symmetry_inverse[symmetry])
+        assert back == move
+        assert move_remove(back) is None
+    assert len(keys) == 1
+    assert key >> 48 == sim_board.encode(2) >> 48
+
+
+def test_best_move_with_canonical_transposition_table(monkeypatch):
+    monkeypatch.setattr(AI_Player, 'CANONICAL_TT', True)
+    board = Board()
+    player1 = Player("Player 1", 1, board)
+    ai = AI_Player("Computer", 2, board, player1)
+    place(player1, 'a7', 'd7')
+    place(ai, 'd6')
+
+    assert ai.get_best_move().dest_name == 'g7'
+    assert ai.stats.tt_hits
+
+
+def test_packed_move_round_trip():
+    sim_board = SimulateGame(p1_id=1, p2_id=2)
+    for move in [Move(2, Phase.PLACING, dest=0), Move(1, Phase.MOVING, src=3, dest=4, remove=0)]:
+        packed = move.pack(sim_board)
+        assert move_dest(packed) == move.dest
+        assert move_remove(packed) == move.remove
+        back = Move.unpack(packed, sim_board)
+        assert (back.player_id, back.phase, back.src, back.dest, back.remove) == \
+               (move.player_id, move.phase, move.src, move.dest, move.remove)
+
+
+def test_incremental_evaluation_matches_full_evaluation():
+    board = Board()
+    player1 = Player("Player 1", 1, board)
+    ai = AI_Player("Computer", 2, board, player1)
+    place(player1, 'a7', 'd7', 'd6')
+    place(ai, 'a1', 'd1', 'b4')
+    sim_board = simulate(board, player1, ai)
+    start = sim_board.evaluate(1)
+    assert start == -sim_board.evaluate(2)
+
+    played = []
+    curr_player = 1
+    for _ in range(6):
+        move = ai.generate_moves(curr_player, sim_board)[0]
+        sim_board.do(move)
+        played.append(move)
+        score, codes = sim_board.score, list(sim_board.line_codes)
+        sim_board.compute_score()
+        assert (score, codes) == (sim_board.score, sim_board.line_codes)
+        curr_player = sim_board.get_opponent(curr_player)
+    for move in reversed(played):
+        sim_board.undo(move)
+    assert sim_board.evaluate(1) == start
+
+
+def test_search_is_reproducible_with_seed():
+    results = []
+    for _ in range(2):
+        board = Board()
+        player1 = Player("Player 1", 1, board)
+        ai = AI_Player("Computer", 2, board, player1, seed=7)
+        place(player1, 'a7')
+        results.append([(move.dest, move.score) for move in [ai.get_best_move(), ai.get_best_move()]])
+    assert results[0] == results[1]
+
+
+def test_batch_evaluation_matches_evaluate():
+    pytest.importorskip("numpy")
+    from ai_player import BatchEvaluator
+    board = Board()
+    player1 = Player("Player 1", 1, board)
+    ai = AI_Player("Computer", 2, board, player1)
+    place(player1, 'a7', 'd7', 'b4', 'f6')
+    place(ai, 'g7', 'd5', 'c3')
+    sim_board = simulate(board, player1, ai)
+
+    batch = BatchEvaluator()
+    moves = ai.generate_moves(2, sim_board)
+    scores = batch.evaluate_moves(sim_board, 2, moves).tolist()
+    for move, score in zip(moves, scores):
+        sim_board.do(move)
+        assert score == sim_board.evaluate(1)
+        sim_board.undo(move)
+
+    occupancy = batch.occupancy([sim_board.bitboards[1]], [sim_board.bitboards[2]])
+    assert occupancy.shape == (1, 2, 24)
+    assert batch.evaluate(occupancy).tolist() == [sim_board.evaluate(1)]
+
+
+def test_best_move_with_batch_evaluation(monkeypatch):
+    pytest.importorskip("numpy")
+    monkeypatch.setattr(AI_Player, 'BATCH_EVAL', True)
+    board = Board()
+    player1 = Player("Player 1", 1, board)
+    ai = AI_Player("Computer", 2, board, player1)
+    place(player1, 'a7', 'd7')
+    place(ai, 'd6')
+
+    assert ai.batch_eval is not None
+    assert ai.get_best_move().dest_name == 'g7'
+
+
+def test_search_async_returns_best_move():
+    board = Board()
+    player1 = Player("Player 1", 1, board)
+    ai = AI_Player("Computer", 2, board, player1)
+    place(player1, 'a7', 'd7')
+    place(ai, 'd6')
+
+    move = ai.search_async().result(timeout=30)
+    ai.close()
+    assert move.dest_name == 'g7'
+
+
+def test_stop_search_returns_best_move_so_far():
+    board = Board()
+    player1 = Player("Player 1", 1, board)
+    ai = AI_Player("Computer", 2, board, player1)
+    place(player1, 'a7', 'b4', 'f6')
+    place(ai, 'g7', 'd5')
+    ai.depth = AI_Player.MAX_DEPTH
+
+    search = ai.search_async()
+    time.sleep(0.2)
+    start = time.monotonic()
+    ai.stop_search()
+    move = search.result(timeout=30)
+    ai.close()
+    assert move is not None
+    assert time.monotonic() - start < 1
+    assert ai.deadline is None
+
+
+def test_stop_search_reaches_parallel_workers():
+    board = Board()
+    player1 = Player("Player 1", 1, board)
+    ai = AI_Player("Computer", 2, board, player1, workers=2)
+    place(player1, 'a7', 'b4', 'f6')
+    place(ai, 'g7', 'd5')
+    ai.depth = AI_Player.MAX_DEPTH
+
+    search = ai.search_async()
+    time.sleep(1)
+    start = time.monotonic()
+    ai.stop_search()
+    move = search.result(timeout=30)
+    ai.close()
+    assert move is not None
+    assert time.monotonic() - start < 1
+
+
+def test_stop_search_does_not_stop_the_next_search():
+    board = Board()
+    player1 = Player("Player 1", 1, board)
+    ai = AI_Player("Computer", 2, board, player1)
+    place(player1, 'a7', 'd7', 'b4')
+    place(ai, 'd6', 'f4')
+    ai.depth = 3
+
+    ai.search_async()
+    ai.stop_search()
+    ai.close()
+    ai.get_best_move()
+    assert ai.stats.depth == 3
+
+
+def test_pondered_reply_is_played_at_once():
+    board = Board()
+    player1 = Player("Player 1", 1, board)
+    ai = AI_Player("Computer", 2, board, player1, seed=3)
+    place(player1, 'a7', 'd7')
+    place(ai, 'g7', 'b6')
+
+    ai.ponder_async().result(timeout=60)
+    assert ai.pondered
+    # The human plays the reply the engine expected most
+    sim_board = SimulateGame(p1_id=1, p2_id=2)
+    sim_board.set_state(board, player1=player1, player2=ai)
+    predicted = ai.order_moves(ai.generate_moves(1, sim_board), 1, sim_board, 1,
+                               ai.predicted_move(sim_board, 1))[0][1]
+    place(player1, SimulateGame.nodes[move_dest(predicted)])
+
+    searches = ai.searches
+    move = ai.get_best_move()
+    ai.close()
+    assert ai.searches == searches + 1
+    assert ai.stats.source == 'ponder'
+    assert ai.stats.ponder_hits == 1
+    assert ai.stats.nodes == 0
+    assert move.dest_name in ai.valid_moves()
+
+
+def test_ponder_leaves_the_logged_stats_alone():
+    board = Board()
+    player1 = Player("Player 1", 1, board)
+    ai = AI_Player("Computer", 2, board, player1, seed=3)
+    place(player1, 'a7', 'd7')
+    place(ai, 'g7', 'b6')
+    ai.get_best_move()
+    logged = ai.stats.as_dict()
+    stats = ai.stats
+
+    sim_board = SimulateGame(p1_id=1, p2_id=2)
+    sim_board.set_state(board, player1=player1, player2=ai)
+    ai.stop_event.set()
+    ai.ponder(sim_board.snapshot())
+    assert stats.as_dict() == logged
+    assert ai.stats is not stats
+
+
+def test_search_stats_are_per_search_and_logged(caplog):
+    board = Board()
+    player1 = Player("Player 1", 1, board)
+    ai = AI_Player("Computer", 2, board, player1)
+    place(player1, 'a7', 'd7', 'b4')
+    place(ai, 'd6', 'f4')
+
+    with caplog.at_level('INFO', logger='ai_player.stats'):
+        ai.get_best_move()
+        first = ai.stats
+        ai.get_best_move()
+    assert ai.stats is not first
+    assert ai.stats.nodes and ai.stats.depth == ai.depth
+    assert ai.stats.branching()['PLACING'] > 1
+
+    records = [record.search_stats for record in caplog.records if record.name == 'ai_player.stats']
+    assert [record['search'] for record in records] == [1, 2]
+    assert json.loads(caplog.records[-1].getMessage()) == records[-1]
+    assert records[-1]['nodes'] == ai.stats.nodes
+
+
+def test_profiled_search_writes_profile(tmp_path):
+    board = Board()
+    player1 = Player("Player 1", 1, board)
+    ai = AI_Player("Computer", 2, board, player1)
+    place(player1, 'a7', 'd7')
+    ai.profile = str(tmp_path)
+
+    move = ai.get_best_move()
+    assert move is not None
+    profile = tmp_path / 'search-Computer-1.prof'
+    assert pstats.Stats(str(profile)).total_calls
@@ -0,0 +1,43 @@
+import copy
+import pytest
+
+from board import MAX_NUM_PIECES
+from benchmark import load_corpus, position_board, bench_position, run_benchmark, compare
+
+
+def test_corpus_positions_are_legal():
+    corpus = load_corpus()
+    assert {position['label'] for position in corpus} == {'opening', 'midgame', 'flying'}
+    assert len({position['name'] for position in corpus}) == len(corpus)
+    for position in corpus:
+        sim_board = position_board(position)
+        assert not sim_board.bitboards[1] & sim_board.bitboards[2]
+        for p_id in (1, 2):
+            assert sim_board.num_on_board(p_id) == len(position['p%d' % p_id])
+            assert sim_board.num_on_board(p_id) <= sim_board.num_placed[p_id] <= MAX_NUM_PIECES
+        assert sim_board.p2_id == position['to_move']
+
+
+def test_bench_position_is_reproducible():
+    position = {'name': 'mill', 'label': 'opening', 'to_move': 2, 'depth': 2, 'p1': ['a7', 'd7'], 'p2': ['d6']}
+    first = bench_position(position, repeat=1)
+    second = bench_position(position, repeat=1, memory=False)
+    assert first['best'] == second['best'] == 'g7'
+    assert first['nodes'] == second['nodes'] == first['stats']['nodes']
+    assert sorted(first['time_to_depth_ms']) == [1, 2]
+    assert first['peak_kb'] > 0
+    assert 'peak_kb' not in second
+
+
+def test_compare_reports_regressions():
+    corpus = [{'name': 'mill', 'label': 'opening', 'to_move': 2, 'depth': 1, 'p1': ['a7', 'd7'], 'p2': ['d6']}]
+    baseline = run_benchmark(corpus, repeat=1, memory=False)
+    assert compare(baseline, baseline) == ([], ["best move agreement: 1/1"])
+
+    results = copy.deepcopy(baseline)
+    result = results['positions']['mill']
+    result['best'] = 'b6'
+    result['time_ms'] = baseline['positions']['mill']['time_ms'] * 2 + 1
+    regressions, notes = compare(results, baseline)
+    assert len(regressions) == 2
+    assert notes == ["best move agreement: 0/1"]
@@ -9,3 +9,95 @@ def board_render():
     assert(board)
 
 
+
+
+def test_mills_follow_place_move_and_remove():
+    board = Board()
+    player1 = Player("Player 1", 1, board)
+    player2 = Player("Player 2", 2, board)
+    for location in ['a7', 'd7', 'g7']:
+        player1.place_piece(list(player1.pieces.values())[0], location)
+    mill = [board.board[name] for name in ['a7', 'd7', 'g7']]
+    assert [list(line) for line in board.last_formed_mills] == [mill]
+    assert board.get_mills() == {node.piece for node in mill}
+    assert set(player1.get_mills()) == board.get_mills()
+
+    player2.place_piece(list(player2.pieces.values())[0], 'd5')
+    assert board.last_formed_mills == []
+    assert len(board.get_mills()) == 3
+
+    # Moving along d7-d6-d5 out of the mill doesn't leave a mill behind
+    piece = board.board['d7'].piece
+    assert board.move_piece(piece, 'd6')
+    assert board.get_mills() == set() and board.last_formed_mills == []
+    assert board.move_piece(piece, 'd7')
+    assert len(board.last_formed_mills) == 1
+
+    assert board.remove_piece(piece)
+    assert board.get_mills() == set()
+
+
+def test_remove_after_mill_clears_last_formed_mills():
+    board = Board()
+    player1 = Player("Player 1", 1, board)
+    player2 = Player("Player 2", 2, board)
+    player2.place_piece(list(player2.pieces.values())[0], 'a1')
+    for location in ['a7', 'd7', 'g7']:
+        player1.place_piece(list(player1.pieces.values())[0], location)
+    assert len(board.last_formed_mills) == 1
+
+    assert player2.remove_piece(board.board['a1'].piece)
+    assert board.last_formed_mills == []
+    # The mill itself is still on the board
+    assert len(player1.get_mills()) == 3
+
+
+def test_placed_pieces_index():
+    board = Board()
+    player1 = Player("Player 1", 1, board)
+    player2 = Player("Player 2", 2, board)
+    assert player1.get_placed_pieces() == [] and player1.count_placed_pieces() == 0
+
+    piece = player1.pieces[0]
+    player1.place_piece(piece, 'a7')
+    player2.place_piece(player2.pieces[0], 'g7')
+    assert player1.get_placed_pieces() == [piece]
+    assert player2.count_placed_pieces() == 1
+    assert len(board.get_pieces()) == 2
+
+    assert player1.move_piece(piece, 'a4')
+    assert player1.get_placed_pieces() == [piece] and board.has_piece(piece)
+
+    assert player1.remove_piece(piece)
+    assert player1.count_placed_pieces() == 0 and not board.has_piece(piece)
+    assert not player1.remove_piece(piece)
+
+
+def test_valid_moves_cache_follows_board_version():
+    board = Board()
+    player1 = Player("Player 1", 1, board)
+    player2 = Player("Player 2", 2, board)
+    moves = player1.valid_moves()
+    assert len(moves) == 24
+    assert player1.valid_moves() is moves
+
+    version = board.version
+    player2.place_piece(player2.pieces[0], 'a7')
+    assert board.version == version + 1
+    assert 'a7' not in player1.valid_moves()
+    assert player1.can_move() and player1.has_any_move()
+
+
+def test_has_any_move_when_blocked():
+    board = Board()
+    player1 = Player("Player 1", 1, board)
+    player2 = Player("Player 2", 2, board)
+    for location in ['a7', 'd7', 'g7', 'b6']:
+        player1.place_piece(player1.pieces[len(player1.pieces) - 1], location)
+    for location in ['a4', 'd6', 'g4', 'f6', 'b4']:
+        player2.place_piece(player2.pieces[len(player2.pieces) - 1], location)
+    player1.pieces.clear()
+
+    assert not player1.has_any_move()
+    assert player1.valid_moves() == set()
+    assert not player1.can_move()
@@ -0,0 +1,93 @@
+import pytest
+from math import comb
+
+import endgame_db
+from ai_player import AI_Player, SimulateGame, MAXINT, MININT
+from endgame_db import EndgameDB, _Solver, _all_positions, class_size, class_file, position_index, LOSS
+from table_file import write_dense
+
+
+def bits(*names):
+    SimulateGame.init_cls()
+    return sum(1 << SimulateGame.node_index[name] for name in names)
+
+
+def initialised(monkeypatch, cls, *positions):
+    # Initialise a solver for just the given (stm, opp) positions of cls
+    monkeypatch.setattr(endgame_db, '_all_positions', lambda a, b: iter(positions))
+    solver = _Solver(cls[0], cls[1], EndgameDB())
+    solver.initialise(cls)
+    return solver
+
+
+def test_position_index_is_minimal_and_reversible():
+    SimulateGame.init_cls()
+    solver = _Solver.__new__(_Solver)
+    seen = set()
+    for stm, opp in _all_positions(2, 2):
+        index = position_index(stm, opp, 2)
+        seen.add(index)
+        assert solver.position((2, 2), index) == (stm, opp)
+    assert seen == set(range(class_size(2, 2)))
+
+    for index in range(0, class_size(4, 3), 9973):
+        stm, opp = solver.position((4, 3), index)
+        assert (stm.bit_count(), opp.bit_count(), stm & opp) == (4, 3, 0)
+        assert position_index(stm, opp, 3) == index
+    assert class_size(4, 3) == comb(24, 4) * comb(20, 3)
+
+
+def test_missing_directory_loads_nothing(tmp_path):
+    db = EndgameDB(str(tmp_path / 'missing'))
+    assert not db
+    assert db.probe(0b111, 0b111000) is None
+
+
+def test_endgame_score():
+    assert AI_Player.endgame_score(0) == 0
+    assert AI_Player.endgame_score(1) > AI_Player.endgame_score(3) > 0
+    assert AI_Player.endgame_score(LOSS) < AI_Player.endgame_score(LOSS + 4) < 0
+
+
+def test_alpha_beta_probes_endgame_table(tmp_path):
+    ai_bits, other_bits = bits('a7', 'd6', 'g1'), bits('b4', 'e5', 'd2')
+    table = bytearray(class_size(3, 3))
+    table[position_index(ai_bits, other_bits, 3)] = 3             # ai to move wins in 3
+    table[position_index(other_bits, ai_bits, 3)] = LOSS + 4      # other to move loses in 4
+    write_dense(class_file(str(tmp_path), 3, 3), table, params=(3, 3))
+
+    ai = AI_Player("Computer", 2, None, None)
+    ai.endgame_db = EndgameDB(str(tmp_path))
+    sim_board = SimulateGame.from_snapshot((1, 2, other_bits, ai_bits, 9, 9))
+    assert ai.alpha_beta(2, sim_board, 3, MININT, MAXINT) == AI_Player.endgame_score(3) > 0
+    assert ai.alpha_beta(1, sim_board, 3, MININT, MAXINT) == -AI_Player.endgame_score(LOSS + 4) > 0
+    assert ai.stats.endgame_hits == 2
+    ai.endgame_db.tables[(3, 3)].close()
+
+
+def test_solver_blocked_position_is_a_loss(monkeypatch):
+    # Four pieces that can't move, and the other side can't fly to them either
+    stm, opp = bits('a7', 'd7', 'g7', 'a4'), bits('d6', 'g4', 'b4', 'a1')
+    solver = initialised(monkeypatch, (4, 4), (stm, opp))
+    assert solver.buckets[0] == [((4, 4), position_index(stm, opp, 4), LOSS)]
+
+
+def test_solver_mill_against_three_pieces_wins_in_one(monkeypatch):
+    stm, opp = bits('a7', 'd7', 'b2'), bits('c5', 'e5', 'd1')
+    solver = initialised(monkeypatch, (3, 3), (stm, opp))
+    index = position_index(stm, opp, 3)
+    assert solver.pending_win[(3, 3)][index] == 1
+    assert solver.buckets[1] == [((3, 3), index, 1)]
+
+
+def test_solver_predecessors_undo_one_move():
+    stm, opp = bits('a7', 'd6', 'g1'), bits('b4', 'e5', 'd2')
+    solver = _Solver.__new__(_Solver)
+    empty = SimulateGame.full_mask & ~(stm | opp)
+    predecessors = list(solver.predecessors((3, 3), stm, opp))
+    # opp just flew one of its three pieces there from any empty node
+    assert len(predecessors) == 3 * empty.bit_count()
+    for cls, index in predecessors:
+        before, after = solver.position(cls, index)
+        assert after == stm
+        assert (before ^ opp).bit_count() == 2 and (before & opp).bit_count() == 2
@@ -0,0 +1,85 @@
+import os
+import pytest
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pygame
+import gui
+from board import Board, Player
+from gui import Gui
+
+
+def make_gui():
+    board = Board()
+    return Gui(board, Player("Player 1", 1, board), Player("Player 2", 2, board))
+
+
+def test_fonts_and_images_load_once():
+    assert gui.get_font('assets/GameCube.ttf', 12) is gui.get_font('assets/GameCube.ttf', 12)
+    assert gui.get_image('assets/background.png') is gui.get_image('assets/background.png')
+
+
+def test_render_text_is_cached():
+    color = pygame.Color('#aaaaaa')
+    text = gui.render_text('assets/Monoid-Regular.ttf', 12, "a7", color)
+    assert gui.render_text('assets/Monoid-Regular.ttf', 12, "a7", color) is text
+    assert gui.render_text('assets/Monoid-Regular.ttf', 12, "a7", pygame.Color('#ffffff')) is not text
+
+
+def test_board_is_rendered_once():
+    g = make_gui()
+    g.draw_board()
+    surface = g.board.surface
+    g.draw_board()
+    assert g.board.surface is surface
+    assert g.screen.get_at((0, 0)) == surface.get_at((0, 0))
+
+
+def test_render_only_updates_what_changed():
+    g = make_gui()
+    assert g.render(("Player 1 turn",)) == [g.screen.get_rect()]
+    assert g.render(("Player 1 turn",)) == []
+
+    piece = g.players[1].pieces[0]
+    old = piece.rect
+    piece.move(300, 300)
+    assert g.render(("Player 1 turn",)) == [piece.rect, old]
+
+
+def test_render_matches_full_redraw():
+    g = make_gui()
+    g.render(("Player 1 turn",), ("debug",))
+    g.players[1].pieces[0].move(300, 300)
+    g.players[2].remove_piece(3)
+    g.render(("Player 2 turn",), ("debug",))
+    rendered = pygame.image.tostring(g.screen, 'RGB')
+
+    g.draw_board()
+    g.game_message("Player 2 turn")
+    g.draw_pieces()
+    g.debug_message("debug")
+    assert pygame.image.tostring(g.screen, 'RGB') == rendered
+
+
+def test_hit_index_follows_moved_pieces():
+    g = make_gui()
+    piece = g.players[1].pieces[0]
+    node = g.board.nodes['d6']
+    assert g.get_piece(pygame.Vector2(node.xy)) is None
+
+    piece.move(*node.xy)
+    assert g.get_piece(pygame.Vector2(node.xy)) is piece
+    assert g.get_piece(pygame.Vector2(node.x + gui.RADIUS, node.y)) is piece
+    assert g.get_node(pygame.Vector2(node.xy)) is node
+
+    g.players[1].remove_piece(0)
+    assert g.get_piece(pygame.Vector2(node.xy)) is None
+    assert g.find_piece(piece.piece) is None
+
+
+def test_find_maps_model_objects():
+    g = make_gui()
+    node = g.board.nodes['g1']
+    assert g.find_node(node.node) is node
+    piece = g.players[2].pieces[4]
+    assert g.find_piece(piece.piece) is piece
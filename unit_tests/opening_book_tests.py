@@ -0,0 +1,73 @@
+import pytest
+import random
+
+from board import Board, Player
+from ai_player import AI_Player, SimulateGame
+from opening_book import OpeningBook, book_positions, build_book, search_position, decode_moves
+
+
+def place(player, *locations):
+    for location in locations:
+        player.place_piece(list(player.pieces.values())[0], location)
+
+
+def test_book_positions_are_canonical():
+    SimulateGame.init_cls()
+    positions = list(book_positions(3))
+    keys = [key for key, _ in positions]
+    assert len(keys) == len(set(keys))
+    # The empty board, then corners and midpoints of the outer (or inner)
+    # ring and of the middle ring
+    assert len(positions) == 1 + 4 + 46
+    for key, snapshot in positions:
+        # In the orientation of the key, not just the same key
+        assert SimulateGame.from_snapshot(snapshot).encode(2) == key
+
+
+def test_book_answers_symmetric_positions(tmp_path):
+    path = str(tmp_path / 'book.db')
+    assert build_book(path, 2, 1) == 5
+    book = OpeningBook(path)
+    assert book and book.plies == 2 and book.depth == 1
+
+    for corner in ['a7', 'g7', 'c3', 'e5']:
+        board = Board()
+        player1 = Player("Player 1", 1, board)
+        ai = AI_Player("Computer", 2, board, player1)
+        ai.opening_book = book
+        place(player1, corner)
+        sim_board = SimulateGame(p1_id=1, p2_id=2)
+        sim_board.set_state(board, player1=player1, player2=ai)
+        assert book.probe(sim_board, 2)
+
+        move = ai.get_best_move()
+        assert ai.stats.book_hits == 1
+        assert ai.stats.nodes == 0
+        assert board.board[move.dest_name].is_empty()
+    book.close()
+
+
+def test_book_moves_follow_the_position_orientation(tmp_path):
+    path = str(tmp_path / 'book.db')
+    build_book(path, 4, 1)
+    book = OpeningBook(path)
+    for mine, theirs in [(['b6', 'd1'], ['a4']), (['a1', 'd3'], ['f6'])]:
+        board = Board()
+        player1 = Player("Player 1", 1, board)
+        ai = AI_Player("Computer", 2, board, player1)
+        place(player1, *mine)
+        place(ai, *theirs)
+        sim_board = SimulateGame(p1_id=1, p2_id=2)
+        sim_board.set_state(board, player1=player1, player2=ai)
+        assert sim_board.canonical_key(2)[1] != 0
+
+        searched = decode_moves(search_position(sim_board.snapshot(), 1), sim_board, 2)
+        assert sorted(book.probe(sim_board, 2)) == sorted(searched)
+    book.close()
+
+
+def test_missing_book(tmp_path):
+    book = OpeningBook(str(tmp_path / 'missing.db'))
+    assert not book
+    sim_board = SimulateGame(p1_id=1, p2_id=2)
+    assert book.choose(sim_board, 2, random.Random()) is None
@@ -0,0 +1,31 @@
+import json
+import pytest
+
+from ai_player import AI_Player
+from benchmark import load_corpus, position_board
+from perft import perft, divide, check, COUNTS_FILE
+
+
+def corpus_position(name):
+    return next(position for position in load_corpus() if position['name'] == name)
+
+
+def test_perft_from_empty_board():
+    sim_board = position_board(corpus_position('opening-empty'))
+    generator = AI_Player("Perft", 1, None, None)
+    assert [perft(generator, sim_board, 1, depth) for depth in range(5)] == [1, 24, 552, 12144, 255024]
+
+
+def test_divide_adds_up_to_perft():
+    sim_board = position_board(corpus_position('midgame-9v8'))
+    generator = AI_Player("Perft", 2, None, None)
+    counts = divide(generator, sim_board, 2, 3)
+    assert len(counts) == perft(generator, sim_board, 2, 1)
+    assert sum(counts.values()) == perft(generator, sim_board, 2, 3)
+    assert 'f2-f4xd2' in counts
+
+
+def test_known_counts():
+    with open(COUNTS_FILE) as f:
+        known = json.load(f)
+    assert check(load_corpus(), known, max_depth=3) == []
@@ -0,0 +1,20 @@
+import io
+import json
+import pytest
+
+from self_play import play_game, run_match
+
+
+def test_play_game_finishes():
+    result = play_game(0, {'depth': 1}, {'depth': 1}, seed=3, max_turns=60)
+    assert result['winner'] in ('a', 'b', 'tie')
+    assert result['error'] is None
+    assert len(result['move_times_ms']) == result['plies']
+
+
+def test_run_match_streams_jsonl():
+    out = io.StringIO()
+    tally = run_match(2, {'depth': 1}, {'depth': 1}, out, seed=5, max_turns=30)
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [line['first'] for line in lines] == ['a', 'b']
+    assert sum(tally.values()) == 2
@@ -0,0 +1,33 @@
+import pytest
+
+from table_file import TableFile, write_dense, write_hashed, DENSE, HASHED
+
+
+def test_dense_table(tmp_path):
+    path = str(tmp_path / 'dense.db')
+    write_dense(path, bytes(range(200)), params=(3, 4))
+    table = TableFile(path)
+    assert table.kind == DENSE
+    assert table.params == [3, 4]
+    assert len(table) == 200
+    assert table[0] == 0 and table[199] == 199
+    table.close()
+
+
+def test_hashed_table_finds_every_key(tmp_path):
+    path = str(tmp_path / 'hashed.db')
+    items = {key * 7919 + (key << 40): key.to_bytes(4, 'little') for key in range(1000)}
+    write_hashed(path, items, 4)
+    table = TableFile(path)
+    assert table.kind == HASHED
+    for key, value in items.items():
+        assert table.lookup(key) == value
+    assert table.lookup(123456789) is None
+    table.close()
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'other.db'
+    path.write_bytes(b'x' * 100)
+    with pytest.raises(ValueError):
+        TableFile(str(path))